@@ -0,0 +1,277 @@
+"""
+  Crawls owner, image and eyes (what get_ape_info returns) for many Bored Apes at once
+
+  ownerOf and tokenURI are read in bulk with contract_reader.ContractReader (Multicall3 or JSON-RPC
+  batches), and the metadata behind the token URIs is fetched concurrently over one pooled aiohttp
+  session (threads running urllib if aiohttp is not installed). An ipfs:// URI names immutable content,
+  so every metadata document is stored on disk under its IPFS path (CID and path within it) and never
+  fetched twice. Only documents that parse as a JSON object (and match their CID, when the URI is a bare
+  CID) are stored, so a gateway error page is never served from disk
+  Records are appended to a JSON lines file, and a restarted crawl skips the apes already complete in it
+  (a record whose on-chain read or metadata fetch failed is written with complete false and retried)
+
+  python ape_crawler.py --rpc https://mainnet.infura.io/v3/<key> --start 0 --end 9999
+  python ape_crawler.py --rpc http://localhost:8545 --gateway http://localhost:8080/ipfs/
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+import urllib.request
+
+from contract_reader import ContractReader
+from ipfs_cache import CIDError, parse_cid, verify_content
+
+BAYC_ADDRESS = "0xBC4CA0EdA7647A8aB7C2061c2E118A18a936f13D"
+GATEWAY = "https://ipfs.io/ipfs/"
+CACHE_DIR = "ape_cache"
+OUT_FILE = "apes.jsonl"
+CONCURRENCY = 32 # Metadata requests in flight
+APES_PER_ROUND = 500 # Apes read on chain, fetched and written per round
+RETRIES = 3
+TIMEOUT = 30 # Seconds per metadata request
+
+
+def ipfs_path(token_uri):
+  """'ipfs://Qm.../1' -> 'Qm.../1'"""
+  for prefix in ("ipfs://ipfs/", "ipfs://"):
+    if token_uri.startswith(prefix):
+      return token_uri[len(prefix):]
+  return token_uri
+
+
+def check_metadata(token_uri, content):
+  """
+    None if content is a usable metadata document for token_uri, otherwise why it is not: it must be a JSON
+    object, and when the URI is a bare CID the bytes must hash to it (a CID with a path cannot be checked)
+  """
+  try:
+    metadata = json.loads(content)
+  except ValueError as e:
+    return f"not JSON ({e})"
+  if not isinstance(metadata, dict):
+    return "not a JSON object"
+  if token_uri.startswith("ipfs://") and '/' not in ipfs_path(token_uri):
+    try:
+      if verify_content(ipfs_path(token_uri), content) is False:
+        return "content does not match its CID"
+    except CIDError:
+      pass
+  return None
+
+
+class MetadataStore:
+  """
+    Metadata documents on disk, <cache_dir>/<xx>/<sha256 of the IPFS path>.json
+    Keyed by the IPFS path rather than the URI, so ipfs://ipfs/<cid> and ipfs://<cid> share one entry
+  """
+
+  def __init__(self, cache_dir=CACHE_DIR):
+    self.cache_dir = cache_dir
+
+  def path(self, token_uri):
+    key = hashlib.sha256(ipfs_path(token_uri).encode('utf-8')).hexdigest()
+    return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+  def get(self, token_uri):
+    """The stored document, or None if there is none or it fails check_metadata (it is then removed)"""
+    path = self.path(token_uri)
+    if not os.path.exists(path):
+      return None
+    with open(path, 'rb') as f:
+      content = f.read()
+    problem = check_metadata(token_uri, content)
+    if problem is not None:
+      print(f"Dropping cached metadata of {token_uri}: {problem}")
+      os.remove(path)
+      return None
+    return content
+
+  def put(self, token_uri, content):
+    """Stores content unless it fails check_metadata, returns False if it was rejected"""
+    problem = check_metadata(token_uri, content)
+    if problem is not None:
+      print(f"Not caching metadata of {token_uri}: {problem}")
+      return False
+    path = self.path(token_uri)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+      f.write(content)
+    os.replace(tmp_path, path)
+    return True
+
+
+def read_tokens(reader, ape_ids):
+  """Returns {ape id: (owner, token URI)}, with None for a call that failed"""
+  calls = []
+  for ape_id in ape_ids:
+    calls += [('ownerOf', (ape_id,)), ('tokenURI', (ape_id,))]
+  results = reader.call_many(calls)
+  return {ape_id: (results[2 * i], results[2 * i + 1]) for i, ape_id in enumerate(ape_ids)}
+
+
+def urllib_get(url):
+  with urllib.request.urlopen(url, timeout=TIMEOUT) as response:
+    return response.status, response.read()
+
+
+async def fetch_metadata(token_uris, store, gateway=GATEWAY, concurrency=CONCURRENCY):
+  """
+    Returns {token URI: metadata bytes or None}, from store where possible, fetching the rest at most
+    concurrency at a time and storing what was fetched
+  """
+  results = {}
+  missing = []
+  for uri in set(token_uris):
+    content = store.get(uri)
+    if content is None:
+      missing.append(uri)
+    else:
+      results[uri] = content
+  if not missing:
+    return results
+
+  limit = asyncio.Semaphore(concurrency)
+  try:
+    # Imported here so the crawler still runs (more slowly) without aiohttp
+    import aiohttp
+  except ImportError:
+    aiohttp = None
+
+  async def fetch_one(get, uri):
+    url = gateway + ipfs_path(uri)
+    async with limit:
+      for attempt in range(RETRIES):
+        try:
+          status, content = await get(url)
+          if status == 200:
+            if store.put(uri, content):
+              return uri, content
+            # A 200 with an error page or the wrong document, another try may get the real one
+          else:
+            print(f"{url}: HTTP {status}")
+        except Exception as e:
+          print(f"{url}: {e}")
+        if attempt + 1 < RETRIES:
+          await asyncio.sleep(2 ** attempt)
+    return uri, None
+
+  if aiohttp is not None:
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=TIMEOUT)) as session:
+      async def get(url):
+        async with session.get(url) as response:
+          return response.status, await response.read()
+      fetched = await asyncio.gather(*(fetch_one(get, uri) for uri in missing))
+  else:
+    async def get(url):
+      return await asyncio.to_thread(urllib_get, url)
+    fetched = await asyncio.gather(*(fetch_one(get, uri) for uri in missing))
+  results.update(fetched)
+  return results
+
+
+def ape_record(ape_id, owner, token_uri, content):
+  """
+    The fields get_ape_info returns, plus the id and token URI
+    complete is False if the owner, the token URI or the metadata could not be read
+  """
+  data = {'id': ape_id, 'owner': owner or "", 'image': "", 'eyes': "", 'token_uri': token_uri, 'complete': False}
+  if owner is None or token_uri is None or content is None:
+    return data
+  try:
+    metadata = json.loads(content)
+  except ValueError as e:
+    print(f"Ape {ape_id}: bad metadata JSON ({e})")
+    return data
+  data['image'] = metadata.get('image', '')
+  for attr in metadata.get('attributes', []):
+    if attr.get('trait_type') == 'Eyes':
+      data['eyes'] = attr.get('value', '')
+      break
+  data['complete'] = True
+  return data
+
+
+def crawled_ids(out_file):
+  """Apes an earlier crawl wrote complete records of to out_file"""
+  if not os.path.exists(out_file):
+    return set()
+  done = set()
+  with open(out_file, 'r') as f:
+    for line in f:
+      try:
+        r = json.loads(line)
+        ape_id = r['id']
+      except (ValueError, KeyError):
+        continue # A line cut short by a crash, the ape is crawled again
+      # Records written before the flag existed are complete if they got an owner and an image
+      if r.get('complete', bool(r.get('owner') and r.get('image'))):
+        done.add(ape_id)
+      else:
+        done.discard(ape_id)
+  return done
+
+
+def crawl(reader, ape_ids, out_file=OUT_FILE, store=None, gateway=GATEWAY, concurrency=CONCURRENCY,
+          apes_per_round=APES_PER_ROUND, resume=True):
+  """
+    Crawls ape_ids and appends one JSON record per ape to out_file
+    reader - anything with ContractReader.call_many, on the BAYC contract
+    Returns the number of apes crawled completely in this run, the others are retried by the next run
+  """
+  store = store or MetadataStore()
+  done = crawled_ids(out_file) if resume else set()
+  todo = [ape_id for ape_id in ape_ids if ape_id not in done]
+  if done:
+    print(f"Resuming: {len(done)} ape(s) already in {out_file}, {len(todo)} to go")
+  crawled = 0
+  incomplete = 0
+  with open(out_file, 'a' if resume else 'w') as f:
+    for i in range(0, len(todo), apes_per_round):
+      round_ids = todo[i:i + apes_per_round]
+      tokens = read_tokens(reader, round_ids)
+      uris = [uri for _, uri in tokens.values() if uri]
+      contents = asyncio.run(fetch_metadata(uris, store, gateway, concurrency))
+      for ape_id in round_ids:
+        owner, uri = tokens[ape_id]
+        record = ape_record(ape_id, owner, uri, contents.get(uri))
+        f.write(json.dumps(record) + "\n")
+        if record['complete']:
+          crawled += 1
+        else:
+          incomplete += 1
+      f.flush()
+      print(f"{crawled}/{len(todo)} ape(s) crawled, {incomplete} incomplete (retried on resume)")
+  return crawled
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--rpc', required=True, help="Ethereum mainnet RPC URL (or a local fork)")
+  parser.add_argument('--abi', default='ape_abi.json')
+  parser.add_argument('--address', default=BAYC_ADDRESS)
+  parser.add_argument('--start', type=int, default=0)
+  parser.add_argument('--end', type=int, default=9999)
+  parser.add_argument('--gateway', default=GATEWAY, help="IPFS gateway URL prefix, ending in /ipfs/")
+  parser.add_argument('--concurrency', type=int, default=CONCURRENCY)
+  parser.add_argument('--cache', default=CACHE_DIR)
+  parser.add_argument('--out', default=OUT_FILE)
+  parser.add_argument('--restart', action='store_true', help="start over instead of resuming")
+  parser.add_argument('--mode', default='auto', help="ContractReader mode: auto, multicall, batch or sequential")
+  args = parser.parse_args()
+
+  from web3 import Web3
+  with open(args.abi, 'r') as f:
+    abi = json.load(f)
+  w3 = Web3(Web3.HTTPProvider(args.rpc))
+  contract = w3.eth.contract(address=Web3.to_checksum_address(args.address), abi=abi)
+  reader = ContractReader(w3, contract, mode=args.mode)
+
+  started = time.perf_counter()
+  n = crawl(reader, range(args.start, args.end + 1), args.out, MetadataStore(args.cache), args.gateway,
+            args.concurrency, resume=not args.restart)
+  print(f"Crawled {n} ape(s) in {time.perf_counter() - started:.1f}s with {reader.requests} RPC round trip(s)")
@@ -0,0 +1,215 @@
+"""
+  Trait index over the Bored Ape metadata ape_crawler.py collected
+
+  For every trait_type the index keeps the list of its values, one value code per ape (an array of
+  uint16, the forward index) and one bitset per value with bit i set if ape i has it (the inverted index).
+  An ape listing one trait_type more than once keeps its first value in the forward index, the others are
+  kept as (id, code) pairs so every value it lists is still set in the bitsets
+  "Eyes=X and Fur=Y" is then an AND of two Python ints, and "owner plus eyes of 5,000 apes" is 5,000
+  array lookups, with no network access. The index is built once from apes.jsonl and the metadata cache
+  and saved to one JSON file, the bitsets are rebuilt from the saved codes when it is loaded
+
+  python ape_traits.py build
+  python ape_traits.py query Eyes=Bored Fur=Brown
+  python ape_traits.py lookup 0 1 2 --traits Eyes Fur
+"""
+import argparse
+import base64
+import json
+import sys
+from array import array
+
+from ape_crawler import MetadataStore, CACHE_DIR, OUT_FILE
+
+INDEX_FILE = "ape_traits.json"
+NO_VALUE = 0xFFFF # Code of an ape without the trait
+
+
+def bitset_ids(bits):
+  """Ids of the set bits, ascending"""
+  ids = []
+  while bits:
+    low = bits & -bits
+    ids.append(low.bit_length() - 1)
+    bits ^= low
+  return ids
+
+
+class TraitIndex:
+  def __init__(self, size, owners, values, codes, extra=None):
+    """
+      size - number of ape ids (ids are 0..size-1)
+      owners - list of owner addresses by id ("" if unknown)
+      values - {trait_type: [value, ...]}
+      codes - {trait_type: array('H') of value positions by id, NO_VALUE if the ape lacks the trait}
+      extra - {trait_type: [(id, value position), ...]} for the values past the first of apes listing a
+              trait_type more than once
+    """
+    self.size = size
+    self.owners = owners
+    self.values = values
+    self.codes = codes
+    self.extra = extra or {}
+    self.positions = {t: {v: i for i, v in enumerate(vs)} for t, vs in values.items()}
+    # Only the codes are saved, the bitsets are rebuilt from them on load (a byte array per value, set
+    # bit by bit, then turned into one int)
+    self.bitsets = {}
+    for trait_type, trait_codes in codes.items():
+      bits = [bytearray(size // 8 + 1) for _ in values[trait_type]]
+      for ape_id, code in enumerate(trait_codes):
+        if code != NO_VALUE:
+          bits[code][ape_id >> 3] |= 1 << (ape_id & 7)
+      for ape_id, code in self.extra.get(trait_type, ()):
+        bits[code][ape_id >> 3] |= 1 << (ape_id & 7)
+      self.bitsets[trait_type] = [int.from_bytes(b, 'little') for b in bits]
+
+  @classmethod
+  def build(cls, records, store):
+    """records - dicts with id, owner and token_uri (lines of apes.jsonl), store - the MetadataStore they were crawled into"""
+    records = list(records)
+    size = max((r['id'] for r in records), default=-1) + 1
+    owners = [""] * size
+    values = {}
+    codes = {}
+    extra = {}
+    positions = {}
+    for r in records:
+      owners[r['id']] = r.get('owner', "")
+      content = store.get(r['token_uri']) if r.get('token_uri') else None
+      if content is None:
+        continue
+      try:
+        attributes = json.loads(content).get('attributes', [])
+      except ValueError:
+        print(f"Ape {r['id']}: bad metadata JSON, not indexed")
+        continue
+      for attr in attributes:
+        trait_type = attr.get('trait_type')
+        if trait_type is None:
+          continue
+        if trait_type not in values:
+          values[trait_type] = []
+          codes[trait_type] = array('H', [NO_VALUE]) * size
+        value = attr.get('value')
+        position = positions.setdefault(trait_type, {})
+        if value not in position:
+          position[value] = len(values[trait_type])
+          values[trait_type].append(value)
+        code = codes[trait_type][r['id']]
+        if code == NO_VALUE:
+          codes[trait_type][r['id']] = position[value]
+        elif code != position[value] and (r['id'], position[value]) not in extra.get(trait_type, ()):
+          # A second value of the same trait_type, it only fits in the bitsets
+          extra.setdefault(trait_type, []).append((r['id'], position[value]))
+    return cls(size, owners, values, codes, extra)
+
+  def save(self, path=INDEX_FILE):
+    saved = {
+      'size': self.size,
+      'owners': self.owners,
+      'traits': {t: {'values': self.values[t], 'codes': base64.b64encode(self.codes[t].tobytes()).decode('ascii')}
+                 for t in self.values},
+      'extra': self.extra,
+    }
+    with open(path, 'w') as f:
+      json.dump(saved, f)
+
+  @classmethod
+  def load(cls, path=INDEX_FILE):
+    with open(path, 'r') as f:
+      saved = json.load(f)
+    values = {}
+    codes = {}
+    for trait_type, trait in saved['traits'].items():
+      values[trait_type] = trait['values']
+      codes[trait_type] = array('H')
+      codes[trait_type].frombytes(base64.b64decode(trait['codes']))
+    extra = {t: [tuple(pair) for pair in pairs] for t, pairs in saved.get('extra', {}).items()}
+    return cls(saved['size'], saved['owners'], values, codes, extra)
+
+  def matching(self, criteria):
+    """
+      Bitset of the apes matching every {trait_type: value} in criteria
+      A value may also be a list of values, any of which matches
+    """
+    bits = (1 << self.size) - 1
+    for trait_type, wanted in criteria.items():
+      wanted = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+      positions = self.positions.get(trait_type, {})
+      any_of = 0
+      for value in wanted:
+        if value in positions:
+          any_of |= self.bitsets[trait_type][positions[value]]
+      bits &= any_of
+    return bits
+
+  def query(self, criteria):
+    """Ids of the apes matching criteria (see matching), ascending"""
+    return bitset_ids(self.matching(criteria))
+
+  def count(self, criteria):
+    return self.matching(criteria).bit_count()
+
+  def trait(self, ape_id, trait_type):
+    """First value of trait_type the ape lists, None if it has none or ape_id is not indexed"""
+    code = self.codes[trait_type][ape_id] if trait_type in self.codes and 0 <= ape_id < self.size else NO_VALUE
+    return None if code == NO_VALUE else self.values[trait_type][code]
+
+  def lookup(self, ape_ids, traits=('Eyes',)):
+    """{id: {'owner': ..., trait_type: value, ...}} for ape_ids, ids that are not indexed get owner "" and no traits"""
+    return {ape_id: dict({'owner': self.owners[ape_id] if 0 <= ape_id < self.size else ""},
+                         **{t: self.trait(ape_id, t) for t in traits}) for ape_id in ape_ids}
+
+  def value_counts(self, trait_type):
+    """{value: number of apes with it}"""
+    return {v: bits.bit_count() for v, bits in zip(self.values[trait_type], self.bitsets[trait_type])}
+
+
+def read_records(path=OUT_FILE):
+  records = {}
+  with open(path, 'r') as f:
+    for line in f:
+      try:
+        r = json.loads(line)
+      except ValueError:
+        continue
+      records[r['id']] = r # A later line (a re-crawl) replaces an earlier one
+  return list(records.values())
+
+
+def parse_criteria(terms):
+  """['Eyes=Bored', 'Fur=Brown,Black'] -> {'Eyes': ['Bored'], 'Fur': ['Brown', 'Black']}"""
+  criteria = {}
+  for term in terms:
+    trait_type, _, value = term.partition('=')
+    criteria.setdefault(trait_type, []).extend(value.split(','))
+  return criteria
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--index', default=INDEX_FILE)
+  commands = parser.add_subparsers(dest='command', required=True)
+  p = commands.add_parser('build', help="build the index from crawled apes")
+  p.add_argument('--apes', default=OUT_FILE)
+  p.add_argument('--cache', default=CACHE_DIR)
+  p = commands.add_parser('query', help="apes with all of TRAIT=VALUE[,VALUE...]")
+  p.add_argument('terms', nargs='+')
+  p = commands.add_parser('lookup', help="owner and traits of some apes")
+  p.add_argument('ids', type=int, nargs='+')
+  p.add_argument('--traits', nargs='+', default=['Eyes'])
+  args = parser.parse_args()
+
+  if args.command == 'build':
+    index = TraitIndex.build(read_records(args.apes), MetadataStore(args.cache))
+    index.save(args.index)
+    print(f"Indexed {index.size} ape(s), {sum(len(v) for v in index.values.values())} trait value(s) to {args.index}")
+    sys.exit(0)
+
+  index = TraitIndex.load(args.index)
+  if args.command == 'query':
+    ids = index.query(parse_criteria(args.terms))
+    print(f"{len(ids)} ape(s): {ids}")
+  else:
+    for ape_id, info in index.lookup(args.ids, args.traits).items():
+      print(ape_id, info)
@@ -0,0 +1,296 @@
+import asyncio
+import json
+import time
+
+from web3 import AsyncWeb3, AsyncHTTPProvider, Web3
+from web3.exceptions import TransactionNotFound
+from web3.middleware import ExtraDataToPOAMiddleware #Necessary for POA chains
+
+from bridge import RPC_URLS, CONTRACT_INFO_FILE, SECRET_KEY_FILE, SCAN_BLOCK_RANGE, RECEIPT_TIMEOUT, NONCE_RETRIES
+from bridge import deposit_to_wrap, unwrap_to_withdraw, load_warden_account
+from hexbytes import HexBytes
+from relay_ledger import RelayLedger, event_keys, LEDGER_DB, MAX_ATTEMPTS, SIGNED, SUBMITTED, FAILED
+from nonce_manager import NonceManager, is_nonce_error, is_already_known
+from reorg import BlockHashCache, async_find_fork, confirmed_head
+
+# --- Configuration ---
+QUEUE_SIZE = 100 # Bounded queues between stages, a slow stage applies back-pressure upstream
+POLL_INTERVAL = 2 # Seconds a fetcher sleeps once it has caught up with its chain
+MAX_BLOCKS_PER_FETCH = 2000 # Largest eth_getLogs window
+RECEIPT_WORKERS = 4 # Concurrent receipt waits per chain
+
+# Event watched on each chain and the function mapping it to the call on the other chain
+WATCHED_EVENTS = {
+    'source': ('Deposit', deposit_to_wrap),
+    'destination': ('Unwrap', unwrap_to_withdraw),
+}
+
+
+async def async_connect_to(chain):
+    """Async counterpart of bridge.connect_to"""
+    w3 = AsyncWeb3(AsyncHTTPProvider(RPC_URLS[chain]))
+    # inject the poa compatibility middleware to the innermost layer
+    w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+    return w3
+
+
+class BridgeEngine:
+    """
+        Watches both chains at the same time and relays events through three concurrent stages:
+          fetch (one task per watched chain) -> build/sign/send (one task per target chain)
+          -> receipts (RECEIPT_WORKERS tasks per target chain)
+        Stages are connected by bounded asyncio queues, so the chains do not wait on each other
+        and a relay only costs the latency of the chains it touches
+    """
+
+    def __init__(self, contracts_info, warden_account, connect=async_connect_to, nonce_manager=None,
+                 start_blocks=None, queue_size=QUEUE_SIZE, ledger=None):
+        # connect - coroutine function mapping a chain name to an AsyncWeb3 (swap in a local chain for testing)
+        # start_blocks - optional {chain: first block to scan}, defaults to the last SCAN_BLOCK_RANGE blocks
+        # ledger - optional RelayLedger, events already in it are skipped and unfinished rows are resumed
+        self.contracts_info = contracts_info
+        self.warden_account = warden_account
+        self.connect = connect
+        self.nonce_manager = nonce_manager or NonceManager()
+        self.next_blocks = dict(start_blocks or {})
+        self.queue_size = queue_size
+        self.ledger = ledger
+        self.w3s = {}
+        self.contracts = {}
+        self.chain_ids = {}
+        self.send_queues = {}
+        self.receipt_queues = {}
+        # Ledger keys queued for a sender or being sent, a rollback keeps their rows and a rescan does not queue them again
+        self.in_flight = set()
+        self.hash_caches = {chain: BlockHashCache() for chain in WATCHED_EVENTS}
+        self.stats = {'events': 0, 'skipped': 0, 'sent': 0, 'confirmed': 0, 'reverted': 0, 'errors': 0}
+
+    async def setup(self):
+        for chain in WATCHED_EVENTS:
+            w3 = await self.connect(chain)
+            self.w3s[chain] = w3
+            info = self.contracts_info[chain]
+            self.contracts[chain] = w3.eth.contract(address=info['address'], abi=info['abi'])
+            self.chain_ids[chain] = await w3.eth.chain_id
+            self.send_queues[chain] = asyncio.Queue(maxsize=self.queue_size)
+            self.receipt_queues[chain] = asyncio.Queue(maxsize=self.queue_size)
+
+    async def fetch_events(self, chain, until_caught_up=False):
+        """
+            Stage 1: read the watched event from chain and queue it for the other chain's sender
+            Only confirmed blocks are read, a reorg below the confirmation depth rewinds the fetcher
+            to the fork and drops the unsent ledger rows after it (except those already queued or being sent)
+        """
+        event_name, to_call = WATCHED_EVENTS[chain]
+        w3 = self.w3s[chain]
+        event = self.contracts[chain].events[event_name]()
+        while True:
+            fork_block = await async_find_fork(self.hash_caches[chain], w3)
+            if fork_block is not None:
+                print(f"Reorg detected on {chain}, rolling back to block {fork_block}")
+                if self.ledger is not None:
+                    self.ledger.rollback(chain, fork_block + 1, keep=self.in_flight)
+                self.next_blocks[chain] = fork_block + 1
+
+            latest_block = confirmed_head(w3, chain, await w3.eth.get_block_number())
+            start_block = self.next_blocks.get(chain, max(0, latest_block - SCAN_BLOCK_RANGE + 1))
+            if start_block > latest_block:
+                if until_caught_up:
+                    break
+                await asyncio.sleep(POLL_INTERVAL)
+                continue
+
+            end_block = min(latest_block, start_block + MAX_BLOCKS_PER_FETCH - 1)
+            try:
+                end_hash = (await w3.eth.get_block(end_block))['hash']
+                if len(self.hash_caches[chain]) == 0 and start_block > 0:
+                    # Anchor below the first window, so a reorg inside it has a known-good block to fall back to
+                    self.hash_caches[chain].record(start_block - 1, (await w3.eth.get_block(start_block - 1))['hash'])
+                events = await event.get_logs(from_block=start_block, to_block=end_block)
+            except Exception as e:
+                print(f"Error fetching {event_name} events on {chain} ({start_block}-{end_block}): {e}")
+                await asyncio.sleep(POLL_INTERVAL)
+                continue
+
+            print(f"Found {len(events)} {event_name} event(s) on {chain} in blocks {start_block}-{end_block}")
+            for evt, key in zip(events, event_keys(events)):
+                target, function_name, args = to_call(evt)
+                self.stats['events'] += 1
+                if key in self.in_flight or (self.ledger is not None and not self.ledger.claim(key, evt, chain, target, function_name, args)):
+                    self.stats['skipped'] += 1
+                    continue
+                self.in_flight.add(key)
+                await self.send_queues[target].put((key, function_name, args))
+            self.next_blocks[chain] = end_block + 1
+            self.hash_caches[chain].record(end_block, end_hash)
+
+        # Tell the sender for the other chain that nothing more is coming
+        for target in self.send_queues:
+            if target != chain:
+                await self.send_queues[target].put(None)
+
+    async def send_transactions(self, chain):
+        """Stage 2: build, sign and send relay transactions on chain, back-to-back with local nonces"""
+        w3 = self.w3s[chain]
+        address = self.warden_account.address
+        while True:
+            item = await self.send_queues[chain].get()
+            if item is None:
+                break
+            key, function_name, args = item
+            for attempt in range(MAX_ATTEMPTS):
+                try:
+                    # build_transaction fills in gas and fees, the nonce is taken locally afterwards
+                    tx = await self.contracts[chain].functions[function_name](*args).build_transaction({
+                        'from': address,
+                        'chainId': self.chain_ids[chain],
+                    })
+                    tx_hash = await self.send(w3, chain, tx, key)
+                    self.stats['sent'] += 1
+                    print(f"{function_name}() for {key} sent on {chain}: {tx_hash.hex()}")
+                    if self.ledger is not None:
+                        self.ledger.mark_submitted(key, tx_hash)
+                    await self.receipt_queues[chain].put((key, function_name, tx_hash))
+                    break
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    print(f"Error relaying {key} with {function_name}(): {e}")
+                    if self.ledger is not None:
+                        # A SIGNED row stays as it is, its transaction may have reached the node before the
+                        # error, the next run's resume_unfinished sends the same bytes again
+                        if self.ledger.state(key) == SIGNED or self.ledger.mark_error(key, e) == FAILED:
+                            break
+                    if attempt + 1 < MAX_ATTEMPTS:
+                        # Errors before the node accepted anything are usually passing RPC trouble
+                        await asyncio.sleep(POLL_INTERVAL)
+            self.in_flight.discard(key)
+
+        for _ in range(RECEIPT_WORKERS):
+            await self.receipt_queues[chain].put(None)
+
+    async def send(self, w3, chain, tx, key=None):
+        """Signs tx with the next local nonce and sends it, storing it in the ledger under key first"""
+        address = self.warden_account.address
+        for attempt in range(NONCE_RETRIES + 1):
+            if not self.nonce_manager.has(chain, address):
+                self.nonce_manager.seed(chain, address, await w3.eth.get_transaction_count(address, 'pending'))
+            tx['nonce'] = self.nonce_manager.take(chain, address)
+            signed_tx = w3.eth.account.sign_transaction(tx, self.warden_account.key)
+            if self.ledger is not None and key is not None:
+                self.ledger.mark_signed(key, Web3.keccak(signed_tx.raw_transaction), signed_tx.raw_transaction, tx['nonce'])
+            try:
+                return await w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+            except Exception as e:
+                if is_already_known(e):
+                    # These same bytes are already in the mempool, resigning with a new nonce would relay twice
+                    return Web3.keccak(signed_tx.raw_transaction)
+                # Reload the counter from the node, the reserved nonce was not used
+                self.nonce_manager.seed(chain, address, await w3.eth.get_transaction_count(address, 'pending'))
+                if not is_nonce_error(e) or attempt == NONCE_RETRIES:
+                    raise
+
+    async def wait_for_receipts(self, chain):
+        """Stage 3: wait for relay transactions on chain to be mined"""
+        w3 = self.w3s[chain]
+        while True:
+            item = await self.receipt_queues[chain].get()
+            if item is None:
+                break
+            key, function_name, tx_hash = item
+            try:
+                tx_receipt = await w3.eth.wait_for_transaction_receipt(tx_hash, timeout=RECEIPT_TIMEOUT)
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"Error waiting for {function_name}() transaction {tx_hash.hex()}: {e}")
+                continue
+            if tx_receipt.status == 0:
+                self.stats['reverted'] += 1
+                if self.ledger is not None:
+                    self.ledger.mark_failed(key, 'reverted')
+                print(f"Warning: {function_name}() transaction {tx_hash.hex()} failed (reverted).")
+            else:
+                self.stats['confirmed'] += 1
+                if self.ledger is not None:
+                    self.ledger.mark_confirmed(key)
+                print(f"{function_name}() transaction {tx_hash.hex()} confirmed in block: {tx_receipt.blockNumber}")
+
+    async def rebroadcast(self, w3, row):
+        """Async counterpart of bridge.rebroadcast: sends a SIGNED row's stored bytes again, None if its nonce was taken"""
+        tx_hash = HexBytes(row['relay_tx'])
+        try:
+            await w3.eth.send_raw_transaction(HexBytes(row['raw_tx']))
+        except Exception as e:
+            if is_already_known(e):
+                return tx_hash
+            if not is_nonce_error(e):
+                raise
+            try:
+                await w3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                return None
+        return tx_hash
+
+    async def resume_unfinished(self):
+        """
+            Queues the relays a crashed run left in the ledger, without rescanning their blocks
+            A SIGNED row has its stored transaction sent again unchanged, it is only rebuilt if that
+            transaction can no longer be mined
+        """
+        unfinished = self.ledger.unfinished() if self.ledger is not None else []
+        if unfinished:
+            print(f"Resuming {len(unfinished)} unfinished relay(s) from the ledger")
+        for row in unfinished:
+            target = row['target_chain']
+            if row['state'] == SIGNED:
+                try:
+                    tx_hash = await self.rebroadcast(self.w3s[target], row)
+                except Exception as e:
+                    print(f"Error rebroadcasting {row['function_name']}() for {row['key']}: {e}")
+                    continue
+                if tx_hash is not None:
+                    self.ledger.mark_submitted(row['key'], tx_hash)
+                    await self.receipt_queues[target].put((row['key'], row['function_name'], tx_hash))
+                    continue
+            if row['state'] == SUBMITTED:
+                await self.receipt_queues[target].put((row['key'], row['function_name'], HexBytes(row['relay_tx'])))
+            else:
+                self.in_flight.add(row['key'])
+                await self.send_queues[target].put((row['key'], row['function_name'], row['args']))
+
+    async def run(self, until_caught_up=False):
+        """
+            Runs every stage until cancelled
+            until_caught_up - stop once both chains have been read up to their current head
+                              and everything queued has been relayed (one-shot mode)
+        """
+        if not self.w3s:
+            await self.setup()
+        # Start the consumers first so resuming a large backlog cannot fill the bounded queues
+        tasks = []
+        for chain in WATCHED_EVENTS:
+            tasks.append(asyncio.create_task(self.send_transactions(chain)))
+            tasks.extend(asyncio.create_task(self.wait_for_receipts(chain)) for _ in range(RECEIPT_WORKERS))
+        await self.resume_unfinished()
+        for chain in WATCHED_EVENTS:
+            tasks.append(asyncio.create_task(self.fetch_events(chain, until_caught_up)))
+        await asyncio.gather(*tasks)
+        return self.stats
+
+
+if __name__ == "__main__":
+    print("Starting Async Bridge Engine...")
+    print(f"Current time: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+
+    with open(CONTRACT_INFO_FILE, 'r') as f:
+        all_contract_info = json.load(f)
+    warden = load_warden_account(SECRET_KEY_FILE)
+
+    ledger = RelayLedger(LEDGER_DB)
+    engine = BridgeEngine(all_contract_info, warden, ledger=ledger)
+    try:
+        asyncio.run(engine.run())
+    except KeyboardInterrupt:
+        print("\nEngine stopped.")
+    finally:
+        ledger.close()
+    print(f"Relay stats: {engine.stats}")
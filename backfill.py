@@ -0,0 +1,160 @@
+"""
+    Historical backfill of Deposit events across several chains and contracts at once
+
+    The block range of every (chain, contract) target is cut into shards, and the shards are scanned
+    concurrently on one thread pool per RPC endpoint, each ENDPOINT_CONCURRENCY threads wide, so every
+    chain makes progress at once. A finished shard's rows are sorted and spooled to a temporary file,
+    and the spools are merged into one CSV in (block, log index) order at the end. Only the shards in
+    flight and one row per target are held in memory
+
+    python backfill.py --targets erc20s.csv --avax 30000000 latest --bsc 45000000 latest
+"""
+import argparse
+import csv
+import heapq
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from listener import connect_to, deposit_row, get_event_chunks, DEPOSIT_ABI
+from block_cache import BlockTimestampCache
+from deposit_writer import DepositWriter
+from reorg import confirmed_head
+
+TARGETS_FILE = "erc20s.csv"
+SHARD_BLOCKS = 50000 # Blocks per shard
+ENDPOINT_CONCURRENCY = 4 # Shards scanned at the same time against one RPC endpoint
+WRITE_BATCH = 5000 # Merged rows handed to the writer at a time
+
+
+def load_targets(filename=TARGETS_FILE):
+    """Reads (chain, address) pairs from a CSV with 'chain' and 'address' columns, like erc20s.csv"""
+    with open(filename, 'r') as f:
+        return [(row['chain'].strip(), row['address'].strip()) for row in csv.DictReader(f)]
+
+
+def make_shards(targets, ranges, shard_blocks=SHARD_BLOCKS):
+    """
+        targets - list of (chain, contract address)
+        ranges - {chain: (start_block, end_block)}
+        Returns a list of (chain, address, from_block, to_block) shards
+    """
+    shards = []
+    for chain, address in targets:
+        if chain not in ranges:
+            print(f"No block range given for {chain}, skipping {address}")
+            continue
+        start_block, end_block = ranges[chain]
+        for from_block in range(start_block, end_block + 1, shard_blocks):
+            shards.append((chain, address, from_block, min(end_block, from_block + shard_blocks - 1)))
+    return shards
+
+
+def scan_shard(w3, chain, address, from_block, to_block, timestamp_cache, spool_path):
+    """
+        Scans one shard and writes its rows to spool_path, one JSON [block number, log index, chain, address, row]
+        per line, in order. Returns the number of rows
+    """
+    contract = w3.eth.contract(address=address, abi=DEPOSIT_ABI)
+    results = []
+    for _, _, events in get_event_chunks(contract.events.Deposit(), from_block, to_block):
+        if not events:
+            continue
+        timestamps = timestamp_cache.fetch(w3, chain, [evt.blockNumber for evt in events])
+        for evt in events:
+            results.append((evt.blockNumber, evt.logIndex, chain, address, deposit_row(chain, evt, timestamps[evt.blockNumber])))
+    results.sort(key=lambda r: r[:4])
+    with open(spool_path, 'w') as f:
+        for r in results:
+            f.write(json.dumps(r) + "\n")
+    print(f"Shard {chain} {address} {from_block}-{to_block}: {len(results)} event(s)")
+    return len(results)
+
+
+def read_spools(paths):
+    """Rows of the spool files in paths, one after the other, each file opened only while it is read"""
+    for path in paths:
+        with open(path, 'r') as f:
+            for line in f:
+                yield tuple(json.loads(line))
+
+
+def merged_rows(spools):
+    """
+        spools - {(chain, address): [(from_block, spool path), ...]}
+        The shards of one target cover disjoint block ranges, so read in from_block order they are one
+        sorted run, and the runs of all targets are merged lazily into (block, log index, chain, address) order
+    """
+    runs = [read_spools([path for _, path in sorted(shards)]) for shards in spools.values()]
+    for r in heapq.merge(*runs, key=lambda r: r[:4]):
+        yield r[4]
+
+
+def backfill(targets, ranges, eventfile='deposit_backfill.csv', connect=connect_to, shard_blocks=SHARD_BLOCKS,
+             concurrency=ENDPOINT_CONCURRENCY, timestamp_cache=None):
+    """
+        Scans every target over the block range of its chain and writes all Deposit rows to eventfile
+        ranges - {chain: (start_block, end_block)}, end_block may be "latest" (the newest confirmed block)
+        connect - function mapping a chain to a Web3 instance (one instance is shared by all shards of a chain)
+        Returns the number of rows written
+    """
+    chains = sorted({chain for chain, _ in targets})
+    w3s = {chain: connect(chain) for chain in chains}
+    ranges = {chain: (start, confirmed_head(w3s[chain], chain) if end == "latest" else end)
+              for chain, (start, end) in ranges.items() if chain in w3s}
+    if timestamp_cache is None:
+        timestamp_cache = BlockTimestampCache()
+
+    shards = make_shards(targets, ranges, shard_blocks)
+    print(f"Backfilling {len(targets)} target(s) in {len(shards)} shard(s)")
+    start = time.perf_counter()
+    writer = DepositWriter(eventfile, ('backfill', tuple(chains)))
+    # One pool per endpoint, so the shards of one chain cannot take every thread while another chain waits
+    pools = {chain: ThreadPoolExecutor(max_workers=max(1, concurrency)) for chain in chains}
+    try:
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(eventfile))) as spool_dir:
+            spools = {}
+            futures = []
+            for i, (chain, address, from_block, to_block) in enumerate(shards):
+                path = os.path.join(spool_dir, f"shard-{i:06d}.jsonl")
+                spools.setdefault((chain, address), []).append((from_block, path))
+                futures.append(pools[chain].submit(scan_shard, w3s[chain], chain, address, from_block, to_block,
+                                                   timestamp_cache, path))
+            for future in as_completed(futures):
+                future.result()
+            batch = []
+            for row in merged_rows(spools):
+                batch.append(row)
+                if len(batch) >= WRITE_BATCH:
+                    writer.write_rows(batch)
+                    writer.rows_done()
+                    batch = []
+            writer.write_rows(batch)
+            writer.rows_done()
+    finally:
+        for pool in pools.values():
+            pool.shutdown(cancel_futures=True)
+        timestamp_cache.save()
+        writer.close()
+    print(f"Wrote {writer.rows} event(s) to {eventfile} in {time.perf_counter() - start:.1f}s")
+    return writer.rows
+
+
+def block_arg(value):
+    return value if value == "latest" else int(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--targets', default=TARGETS_FILE, help="CSV of chain,address to scan")
+    parser.add_argument('--avax', nargs=2, type=block_arg, metavar=('START', 'END'))
+    parser.add_argument('--bsc', nargs=2, type=block_arg, metavar=('START', 'END'))
+    parser.add_argument('--out', default='deposit_backfill.csv')
+    parser.add_argument('--shard-blocks', type=int, default=SHARD_BLOCKS)
+    parser.add_argument('--concurrency', type=int, default=ENDPOINT_CONCURRENCY, help="shards in flight per endpoint")
+    args = parser.parse_args()
+
+    block_ranges = {chain: tuple(r) for chain, r in (('avax', args.avax), ('bsc', args.bsc)) if r}
+    backfill(load_targets(args.targets), block_ranges, args.out, shard_blocks=args.shard_blocks, concurrency=args.concurrency)
@@ -0,0 +1,69 @@
+"""
+    Compares the block-by-block Deposit scan listener.py used for large ranges
+    (one filter per block) with the adaptive chunked eth_getLogs scan, on a local chain stand-in
+    Reports blocks/sec and RPC calls per 10k blocks for each
+
+    python bench_listener.py --blocks 20000 --deposits 300 --latency 0.001
+"""
+import argparse
+import random
+import time
+
+from listener import get_event_chunks
+from local_chain import LocalChain
+
+CONTRACT = "0x0000000000000000000000000000000000000001"
+
+
+def make_chain(blocks, deposits, latency, max_results, seed=0):
+    rng = random.Random(seed)
+    chain = LocalChain(head=blocks, max_results=max_results, latency=latency)
+    for _ in range(deposits):
+        # Cluster some deposits into busy stretches, like real traffic
+        block_number = rng.choice([rng.randint(1, blocks), rng.randint(blocks // 2, blocks // 2 + 200)])
+        chain.add_log(block_number, CONTRACT, 'Deposit', token=CONTRACT, recipient=CONTRACT, amount=rng.randint(1, 10**18))
+    return chain
+
+
+def scan_block_by_block(event, start_block, end_block):
+    """The previous large-range path of listener.scan_blocks: a new filter for every block"""
+    found = 0
+    for block_num in range(start_block, end_block + 1):
+        event_filter = event.create_filter(from_block=block_num, to_block=block_num)
+        found += len(event_filter.get_all_entries())
+    return found
+
+
+def scan_chunked(event, start_block, end_block):
+    found = 0
+    for _, _, events in get_event_chunks(event, start_block, end_block):
+        found += len(events)
+    return found
+
+
+def bench(label, scan, chain, start_block, end_block):
+    chain.rpc_calls.clear()
+    event = chain.eth.contract(CONTRACT).events.Deposit()
+    start = time.perf_counter()
+    found = scan(event, start_block, end_block)
+    elapsed = time.perf_counter() - start
+    blocks = end_block - start_block + 1
+    calls = chain.total_calls()
+    print(f"{label:<16} {found:>8} {blocks / elapsed:>14.0f} {calls * 10000 / blocks:>16.1f} {elapsed:>9.2f}")
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--blocks', type=int, default=20000)
+    parser.add_argument('--deposits', type=int, default=300)
+    parser.add_argument('--latency', type=float, default=0.001, help="simulated seconds per RPC call")
+    parser.add_argument('--max-results', type=int, default=50, help="simulated eth_getLogs result limit")
+    args = parser.parse_args()
+
+    chain = make_chain(args.blocks, args.deposits, args.latency, args.max_results)
+    print(f"{args.blocks} blocks, {args.deposits} deposits, {args.latency * 1000:.1f} ms per call")
+    print(f"{'scan':<16} {'events':>8} {'blocks/sec':>14} {'calls/10k blocks':>16} {'seconds':>9}")
+    old = bench('block-by-block', scan_block_by_block, chain, 1, args.blocks)
+    new = bench('chunked', scan_chunked, chain, 1, args.blocks)
+    assert old == new, f"scans disagree: {old} vs {new}"
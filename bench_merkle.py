@@ -0,0 +1,142 @@
+"""
+    Benchmarks for building the Merkle leaves of submitProof
+
+    primes - the old trial division generate_primes against the segmented sieve in primes.py,
+             for n = 8192, 1e5 and 1e6 by default, checking both return the same list
+    tree   - the old list-of-bytes build_merkle hashing with Web3.solidity_keccak against
+             merkle_engine.MerkleTree, checking both give the same root and
+             that the engine's proofs verify against it (needs web3)
+    verify - merkle_engine.verify_many on a list of (leaf, proof) claims, in-process and on a process pool
+
+    python bench_merkle.py primes --n 8192 100000 1000000
+    python bench_merkle.py tree --n 8192 100000 1048576
+    python bench_merkle.py verify --leaves 8192 --claims 100000
+"""
+import argparse
+import os
+import time
+
+import primes
+
+
+def generate_primes_old(num_primes):
+    """The trial division submitProof.generate_primes used before the sieve"""
+    primes_list = []
+    n = 2
+    while len(primes_list) < num_primes:
+        is_prime = True
+        for p in primes_list:
+            if p * p > n:
+                break
+            if n % p == 0:
+                is_prime = False
+                break
+        if is_prime:
+            primes_list.append(n)
+        n += 1
+    return primes_list
+
+
+def build_merkle_old(leaves):
+    """The list-of-levels submitProof.build_merkle built before merkle_engine, one solidity_keccak per pair"""
+    # Imported here so the primes bench runs without web3
+    from web3 import Web3
+
+    def hash_pair(a, b):
+        if a < b:
+            return Web3.solidity_keccak(['bytes32', 'bytes32'], [a, b])
+        return Web3.solidity_keccak(['bytes32', 'bytes32'], [b, a])
+
+    tree = [leaves.copy()]
+    current_level = leaves
+    while len(current_level) > 1:
+        next_level = []
+        for i in range(0, len(current_level), 2):
+            left = current_level[i]
+            right = current_level[i + 1] if i + 1 < len(current_level) else left
+            next_level.append(hash_pair(left, right))
+        tree.append(next_level)
+        current_level = next_level
+    return tree
+
+
+def timed(f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_primes(args):
+    print(f"sieve backend: {'numpy' if primes.np is not None else 'bytearray'}")
+    print(f"{'n':>9} {'trial division s':>17} {'sieve s':>9} {'speedup':>8}")
+    for n in args.n:
+        new, new_seconds = timed(primes.first_primes, n)
+        if n > args.max_old:
+            print(f"{n:>9} {'skipped':>17} {new_seconds:>9.3f} {'':>8}")
+            continue
+        old, old_seconds = timed(generate_primes_old, n)
+        assert old == new, f"n={n}: the sieve returned different primes"
+        print(f"{n:>9} {old_seconds:>17.3f} {new_seconds:>9.3f} {old_seconds / new_seconds:>7.1f}x")
+
+
+def bench_tree(args):
+    from merkle_engine import MerkleTree, verify_proof
+
+    print(f"{'leaves':>9} {'solidity_keccak s':>18} {'engine s':>9} {'speedup':>8}")
+    for n in args.n:
+        leaves = [p.to_bytes(32, 'big') for p in primes.first_primes(n)]
+        tree, new_seconds = timed(MerkleTree.from_leaves, leaves)
+        if n > args.max_old:
+            print(f"{n:>9} {'skipped':>18} {new_seconds:>9.3f} {'':>8}")
+            continue
+        old, old_seconds = timed(build_merkle_old, leaves)
+        assert bytes(old[-1][0]) == tree.root, f"n={n}: the roots differ"
+        # The first and last leaves take the odd-level paths, the rest is a sample
+        for i in {0, n // 2, n - 2, n - 1} - {-1}:
+            assert verify_proof(old[-1][0], leaves[i], tree.proof(i)), f"n={n}: the proof of leaf {i} does not verify"
+        print(f"{n:>9} {old_seconds:>18.3f} {new_seconds:>9.3f} {old_seconds / new_seconds:>7.1f}x")
+
+
+def bench_verify(args):
+    import random
+    from merkle_engine import MerkleTree, verify_many
+
+    tree = MerkleTree.from_leaves([p.to_bytes(32, 'big') for p in primes.first_primes(args.leaves)])
+    rng = random.Random(0)
+    indices = [rng.randrange(tree.num_leaves) for _ in range(args.claims)]
+    claims = [(tree[0][i], tree.proof(i)) for i in indices]
+    # Break every tenth claim, so the audit has something to find
+    claims = [(leaf, proof[::-1] if n % 10 == 0 else proof) for n, (leaf, proof) in enumerate(claims)]
+
+    print(f"{args.claims} claims against a {args.leaves}-leaf tree")
+    print(f"{'processes':>9} {'claims/sec':>12} {'invalid':>8}")
+    expected = None
+    for processes in args.processes:
+        results, seconds = timed(verify_many, tree.root, claims, processes)
+        expected = expected or results
+        assert results == expected, "verify_many results depend on the number of processes"
+        print(f"{processes:>9} {args.claims / seconds:>12.0f} {results.count(False):>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('primes', help="trial division vs segmented sieve")
+    p.add_argument('--n', type=int, nargs='+', default=[8192, 100000, 1000000])
+    p.add_argument('--max-old', type=int, default=1000000, help="skip trial division above this n (it takes minutes)")
+    p.set_defaults(run=bench_primes)
+
+    p = commands.add_parser('tree', help="solidity_keccak list build vs the bytearray engine")
+    p.add_argument('--n', type=int, nargs='+', default=[8192, 100000, 1 << 20])
+    p.add_argument('--max-old', type=int, default=1 << 20, help="skip the old build above this many leaves")
+    p.set_defaults(run=bench_tree)
+
+    p = commands.add_parser('verify', help="bulk proof verification, in-process and parallel")
+    p.add_argument('--leaves', type=int, default=8192)
+    p.add_argument('--claims', type=int, default=100000)
+    p.add_argument('--processes', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    p.set_defaults(run=bench_verify)
+
+    args = parser.parse_args()
+    args.run(args)
@@ -0,0 +1,215 @@
+"""
+    Mining benchmarks for findBlockNonce
+
+    compare - the original mine_block loop (full rehash of the block data and a bin() string check
+              for every nonce) against the midstate-copy and bitmask search, hashes/sec for each k
+    sweep   - runs mine_block over a grid of difficulties k and payloads (number and size of the
+              transactions) and records hashes/sec, the time-to-solution distribution and peak memory
+              to a JSON file. With --baseline the run is compared against an earlier result file and
+              the exit status is 1 if any cell got slower or bigger than --tolerance allows
+
+    python bench_mining.py compare --min-k 8 --max-k 24 --hashes 200000
+    python bench_mining.py sweep --k 8 12 16 20 --lines 1 10 100 --out mining.json
+    python bench_mining.py sweep --baseline mining.json --out mining_new.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from findBlockNonce import mine_block, search_nonces, get_random_lines
+
+
+def search_nonces_old(base_data, k, start, stop):
+    """The loop mine_block used to run, limited to [start, stop)"""
+    for nonce_int in range(start, stop):
+        nonce_bytes = str(nonce_int).encode('utf-8')
+        hash_result = hashlib.sha256(base_data + nonce_bytes).digest()
+        bin_hash = bin(int.from_bytes(hash_result, byteorder='big'))
+        if bin_hash.endswith('0' * k):
+            return nonce_int
+    return None
+
+
+def hash_rate(search, base_data, k, hashes):
+    """
+        Runs search over nonces 0..hashes-1, restarting after every nonce it finds
+        Returns (hashes/sec, nonces found)
+    """
+    found = []
+    start = 0
+    began = time.perf_counter()
+    while start < hashes:
+        nonce_int = search(base_data, k, start, hashes)
+        if nonce_int is None:
+            break
+        found.append(nonce_int)
+        start = nonce_int + 1
+    return hashes / (time.perf_counter() - began), found
+
+
+def compare(args):
+    if os.path.exists(args.file):
+        with open(args.file, 'r') as f:
+            lines = [line.strip() for _, line in zip(range(args.lines), f)]
+    else:
+        lines = [f"transaction {i}: {'x' * 60}" for i in range(args.lines)]
+    base_data = hashlib.sha256(b'previous block').digest() + "".join(lines).encode('utf-8')
+    print(f"{len(base_data)} bytes of block data, {args.hashes} nonces per run")
+    print(f"{'k':>3} {'old hashes/sec':>15} {'new hashes/sec':>15} {'speedup':>8}")
+    for k in range(args.min_k, args.max_k + 1):
+        old_rate, old_found = hash_rate(search_nonces_old, base_data, k, args.hashes)
+        new_rate, new_found = hash_rate(search_nonces, base_data, k, args.hashes)
+        assert old_found == new_found, f"k={k}: searches disagree"
+        print(f"{k:>3} {old_rate:>15.0f} {new_rate:>15.0f} {new_rate / old_rate:>7.2f}x")
+    return 0
+
+
+def make_transactions(rng, lines, line_bytes, filename=None):
+    """lines transactions, drawn with get_random_lines if filename exists, otherwise line_bytes of random text each, both from rng"""
+    if filename and os.path.exists(filename):
+        return get_random_lines(filename, lines, rng=rng)
+    alphabet = "abcdefghijklmnopqrstuvwxyz0123456789 "
+    return ["".join(rng.choice(alphabet) for _ in range(line_bytes)) for _ in range(lines)]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run_cell(k, lines, line_bytes, trials, seed, filename=None):
+    """
+        Mines trials blocks with difficulty k, each with its own prev_hash and transactions
+        Nonces are searched from 0, so nonce + 1 is the number of hashes a solution took
+        Peak memory is measured on one extra block, tracemalloc slows allocation down too much to
+        trace the timed runs (and only sees this process, not the workers of a parallel search)
+    """
+    rng = random.Random(f"{seed}-{k}-{lines}-{line_bytes}")
+    times = []
+    hashes = []
+    for _ in range(trials):
+        prev_hash = rng.randbytes(32)
+        transactions = make_transactions(rng, lines, line_bytes, filename)
+        start = time.perf_counter()
+        nonce = mine_block(k, prev_hash, transactions)
+        times.append(time.perf_counter() - start)
+        hashes.append(int(nonce) + 1)
+
+    prev_hash = rng.randbytes(32)
+    transactions = make_transactions(rng, lines, line_bytes, filename)
+    tracemalloc.start()
+    mine_block(k, prev_hash, transactions)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'k': k,
+        'lines': lines,
+        'line_bytes': line_bytes,
+        'payload_bytes': 32 + sum(len(t.encode('utf-8')) for t in transactions),
+        'trials': trials,
+        'hashes_per_sec': sum(hashes) / sum(times),
+        'hashes': {'mean': statistics.mean(hashes), 'median': statistics.median(hashes), 'max': max(hashes)},
+        'seconds': {
+            'min': min(times),
+            'median': statistics.median(times),
+            'p90': percentile(times, 0.9),
+            'max': max(times),
+            'mean': statistics.mean(times),
+            'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        },
+        'peak_memory_bytes': peak,
+    }
+
+
+def cell_key(cell):
+    return f"k={cell['k']},lines={cell['lines']},line_bytes={cell['line_bytes']}"
+
+
+def find_regressions(results, baseline, tolerance):
+    """
+        Compares every cell that is in both runs
+        A cell regresses if its hashes/sec dropped, or its peak memory grew, by more than tolerance (a fraction)
+        Returns a list of messages, empty if nothing regressed
+    """
+    old_cells = {cell_key(cell): cell for cell in baseline['cells']}
+    regressions = []
+    for cell in results['cells']:
+        old = old_cells.get(cell_key(cell))
+        if old is None:
+            continue
+        if cell['hashes_per_sec'] < old['hashes_per_sec'] * (1 - tolerance):
+            regressions.append(f"{cell_key(cell)}: {cell['hashes_per_sec']:.0f} hashes/sec, baseline {old['hashes_per_sec']:.0f}")
+        if cell['peak_memory_bytes'] > old['peak_memory_bytes'] * (1 + tolerance):
+            regressions.append(f"{cell_key(cell)}: peak memory {cell['peak_memory_bytes']} bytes, baseline {old['peak_memory_bytes']}")
+    return regressions
+
+
+def sweep(args):
+    results = {
+        'created': time.time(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': args.seed,
+        'cells': [],
+    }
+    print(f"{'k':>3} {'lines':>6} {'bytes':>6} {'hashes/sec':>12} {'median s':>9} {'p90 s':>9} {'max s':>9} {'peak KiB':>9}")
+    for k in args.k:
+        for lines in args.lines:
+            for line_bytes in args.line_bytes:
+                cell = run_cell(k, lines, line_bytes, args.trials, args.seed, args.file)
+                results['cells'].append(cell)
+                s = cell['seconds']
+                print(f"{k:>3} {lines:>6} {line_bytes:>6} {cell['hashes_per_sec']:>12.0f} {s['median']:>9.3f} {s['p90']:>9.3f}"
+                      f" {s['max']:>9.3f} {cell['peak_memory_bytes'] / 1024:>9.1f}")
+
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('compare', help="old vs new nonce search, hashes/sec per k")
+    p.add_argument('--min-k', type=int, default=8)
+    p.add_argument('--max-k', type=int, default=24)
+    p.add_argument('--hashes', type=int, default=200000, help="nonces tried per k and implementation")
+    p.add_argument('--lines', type=int, default=10, help="transactions in the block data")
+    p.add_argument('--file', default="bitcoin_text.txt", help="transactions file, made up lines are used if missing")
+    p.set_defaults(run=compare)
+
+    p = commands.add_parser('sweep', help="mine_block over a grid of k and payload sizes, results to JSON")
+    p.add_argument('--k', type=int, nargs='+', default=[8, 12, 16, 20])
+    p.add_argument('--lines', type=int, nargs='+', default=[1, 10, 100], help="transactions per block")
+    p.add_argument('--line-bytes', type=int, nargs='+', default=[64], help="size of each made up transaction")
+    p.add_argument('--trials', type=int, default=5, help="blocks mined per cell")
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--file', default=None, help="draw transactions from this file with get_random_lines instead")
+    p.add_argument('--out', default="mining_bench.json")
+    p.add_argument('--baseline', default=None, help="earlier sweep output to check for regressions")
+    p.add_argument('--tolerance', type=float, default=0.15, help="allowed slowdown or memory growth, as a fraction")
+    p.set_defaults(run=sweep)
+
+    args = parser.parse_args()
+    sys.exit(args.run(args))
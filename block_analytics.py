@@ -0,0 +1,212 @@
+"""
+	Block-ordering analytics for reading_the_chain.is_ordered_block over whole block ranges
+
+	Full blocks are fetched in JSON-RPC batches (block_cache.fetch_blocks) with at most `workers`
+	batches in flight and up to WINDOW times as many fetched ahead of the oldest one still missing, and every block is reduced in one linear pass to its priority fees and
+	whether they are in decreasing order. Blocks can be recorded to a JSON fixture file and the same
+	analysis replayed from it without a node
+
+	python block_analytics.py 19000000 19010000 --out ordering.csv
+	python block_analytics.py 19000000 19000100 --record blocks.json
+	python block_analytics.py --fixture blocks.json
+"""
+import argparse
+import csv
+import json
+import time
+from collections import Counter, deque
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+
+from block_cache import fetch_blocks
+
+BATCH_SIZE = 20 # Full blocks per JSON-RPC batch, full blocks are large
+WORKERS = 4 # Batches in flight at once
+WINDOW = 4 # Batches fetched or waiting to be consumed per worker, what the other workers get ahead by while one batch is slow
+REPORT_COLUMNS = ['number', 'transactions', 'base_fee', 'ordered', 'inversions', 'first_inversion', 'type0', 'type2', 'other_types']
+
+
+def priority_fee(tx, base_fee):
+	"""
+	Priority fee of one transaction (a web3 AttributeDict or a plain dict from a fixture)
+		*Type 0* tx.gasPrice - block.baseFeePerGas
+		*Type 2* min( tx.maxPriorityFeePerGas, tx.maxFeePerGas - block.baseFeePerGas )
+	"""
+	max_priority = tx.get('maxPriorityFeePerGas')
+	max_fee = tx.get('maxFeePerGas')
+	if max_priority is not None and max_fee is not None:
+		return min(max_priority, max_fee - base_fee)
+	gas_price = tx.get('gasPrice')
+	return gas_price - base_fee if gas_price is not None else 0
+
+
+def analyze_block(block):
+	"""
+	One pass over the transactions of a full block
+	Returns its report row: ordered is True if the priority fees never increase, inversions counts the
+	adjacent pairs where they do (first_inversion is the index of the first such transaction)
+	"""
+	base_fee = block.get('baseFeePerGas') or 0
+	types = Counter()
+	inversions = 0
+	first_inversion = None
+	previous = None
+	count = 0
+	for i, tx in enumerate(block['transactions']):
+		fee = priority_fee(tx, base_fee)
+		if previous is not None and fee > previous:
+			inversions += 1
+			if first_inversion is None:
+				first_inversion = i
+		previous = fee
+		types[tx_type(tx)] += 1
+		count += 1
+	return {
+		'number': block['number'],
+		'transactions': count,
+		'base_fee': base_fee,
+		'ordered': inversions == 0,
+		'inversions': inversions,
+		'first_inversion': first_inversion,
+		'type0': types[0],
+		'type2': types[2],
+		'other_types': count - types[0] - types[2],
+	}
+
+
+def tx_type(tx):
+	t = tx.get('type', 0)
+	return int(t, 16) if isinstance(t, str) else t
+
+
+def summarize(reports):
+	"""Aggregate statistics over per-block reports"""
+	blocks = len(reports)
+	ordered = sum(r['ordered'] for r in reports)
+	transactions = sum(r['transactions'] for r in reports)
+	non_trivial = [r for r in reports if r['transactions'] > 1]
+	return {
+		'blocks': blocks,
+		'ordered_blocks': ordered,
+		'ordered_share': ordered / blocks if blocks else None,
+		# Blocks with 0 or 1 transaction are ordered by definition, the share without them is more telling
+		'ordered_share_multi_tx': sum(r['ordered'] for r in non_trivial) / len(non_trivial) if non_trivial else None,
+		'empty_blocks': sum(r['transactions'] == 0 for r in reports),
+		'transactions': transactions,
+		'transactions_per_block': transactions / blocks if blocks else None,
+		'inversions': sum(r['inversions'] for r in reports),
+		'type0': sum(r['type0'] for r in reports),
+		'type2': sum(r['type2'] for r in reports),
+		'other_types': sum(r['other_types'] for r in reports),
+	}
+
+
+def rpc_fetcher(w3, batch_size=BATCH_SIZE):
+	"""fetch function for analyze_range that reads full blocks from a node"""
+	return lambda block_numbers: fetch_blocks(w3, block_numbers, batch_size, full_transactions=True)
+
+
+def to_plain(value):
+	"""Turns web3 AttributeDicts, HexBytes and lists into JSON-friendly dicts, hex strings and lists"""
+	if isinstance(value, Mapping):
+		return {k: to_plain(v) for k, v in value.items()}
+	if isinstance(value, (list, tuple)):
+		return [to_plain(v) for v in value]
+	if isinstance(value, (bytes, bytearray)):
+		return '0x' + bytes(value).hex()
+	return value
+
+
+def load_fixture(path):
+	"""Blocks recorded by record_fixture, as {block number: block}"""
+	with open(path, 'r') as f:
+		return {block['number']: block for block in json.load(f)}
+
+
+def record_fixture(blocks, path):
+	with open(path, 'w') as f:
+		json.dump([to_plain(block) for block in blocks], f)
+
+
+def fixture_fetcher(path):
+	"""fetch function for analyze_range that replays blocks recorded with record_fixture"""
+	blocks = load_fixture(path)
+	return lambda block_numbers: [blocks[n] for n in block_numbers]
+
+
+def fetch_in_order(fetch, batches, workers=WORKERS):
+	"""
+	Yields fetch(batch) for every batch, in order, with up to `workers` fetches running at once
+	A sliding window of workers * WINDOW batches: while the oldest batch is slow the other workers keep
+	fetching the ones after it, and a new batch is queued as soon as the oldest is handed out, so a slow
+	batch does not stall the others and memory stays bounded by the window
+	"""
+	with ThreadPoolExecutor(max_workers=workers) as pool:
+		window = deque()
+		for batch in batches:
+			window.append(pool.submit(fetch, batch))
+			if len(window) >= workers * WINDOW:
+				yield window.popleft().result()
+		while window:
+			yield window.popleft().result()
+
+
+def analyze_range(fetch, start_block, end_block, batch_size=BATCH_SIZE, workers=WORKERS, keep_blocks=False):
+	"""
+	Analyzes blocks start_block..end_block (inclusive)
+	fetch - function mapping a list of block numbers to full blocks, see rpc_fetcher and fixture_fetcher
+	Returns (per-block reports in block order, aggregate statistics, the raw blocks if keep_blocks else None)
+	"""
+	batches = [list(range(n, min(end_block, n + batch_size - 1) + 1)) for n in range(start_block, end_block + 1, batch_size)]
+	reports = []
+	kept = [] if keep_blocks else None
+	# Only `workers` batches are fetched at a time, and each is reduced to its reports as soon as it arrives,
+	# so memory holds a few batches of full blocks, not the whole range
+	for blocks in fetch_in_order(fetch, batches, workers):
+		reports.extend(analyze_block(block) for block in blocks)
+		if keep_blocks:
+			kept.extend(blocks)
+	return reports, summarize(reports), kept
+
+
+def write_report(reports, path):
+	with open(path, 'w', newline='') as f:
+		writer = csv.DictWriter(f, fieldnames=REPORT_COLUMNS)
+		writer.writeheader()
+		writer.writerows(reports)
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('start', type=int, nargs='?')
+	parser.add_argument('end', type=int, nargs='?')
+	parser.add_argument('--fixture', help="replay blocks from this recorded file instead of a node")
+	parser.add_argument('--record', help="also save the fetched blocks to this fixture file")
+	parser.add_argument('--out', help="per-block report CSV")
+	parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+	parser.add_argument('--workers', type=int, default=WORKERS)
+	args = parser.parse_args()
+
+	if args.fixture:
+		fetch = fixture_fetcher(args.fixture)
+		recorded = sorted(load_fixture(args.fixture))
+		start_block = args.start if args.start is not None else recorded[0]
+		end_block = args.end if args.end is not None else recorded[-1]
+	else:
+		if args.start is None or args.end is None:
+			parser.error("a block range is needed unless --fixture is given")
+		from reading_the_chain import connect_to_eth
+		fetch = rpc_fetcher(connect_to_eth(), args.batch_size)
+		start_block, end_block = args.start, args.end
+
+	started = time.perf_counter()
+	reports, stats, blocks = analyze_range(fetch, start_block, end_block, args.batch_size, args.workers, keep_blocks=bool(args.record))
+	elapsed = time.perf_counter() - started
+	if args.record:
+		record_fixture(blocks, args.record)
+		print(f"Recorded {len(blocks)} block(s) to {args.record}")
+	if args.out:
+		write_report(reports, args.out)
+	for name, value in stats.items():
+		print(f"{name:>24}: {value}")
+	print(f"{len(reports)} block(s) in {elapsed:.1f}s ({len(reports) / elapsed:.0f} blocks/sec)")
@@ -0,0 +1,108 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+TIMESTAMP_CACHE_FILE = "block_timestamps.json"
+CACHE_SIZE = 100000 # Most block timestamps kept (memory and on disk)
+BATCH_SIZE = 100 # Blocks requested per JSON-RPC batch
+
+
+def fetch_blocks(w3, block_numbers, batch_size=BATCH_SIZE, full_transactions=False):
+    """
+        Fetches the headers of block_numbers with one JSON-RPC batch per batch_size blocks
+        (with full transaction objects instead of hashes if full_transactions)
+        Falls back to one eth_getBlockByNumber per block if the node (or provider) cannot batch
+        Returns a list of blocks in the same order as block_numbers
+    """
+    block_numbers = list(block_numbers)
+    blocks = []
+    for i in range(0, len(block_numbers), batch_size):
+        chunk = block_numbers[i:i + batch_size]
+        try:
+            with w3.batch_requests() as batch:
+                for n in chunk:
+                    batch.add(w3.eth.get_block(n, full_transactions))
+                blocks.extend(batch.execute())
+        except Exception as e:
+            print(f"Batch request failed ({e}), fetching {len(chunk)} block(s) one by one")
+            blocks.extend(w3.eth.get_block(n, full_transactions) for n in chunk)
+    return blocks
+
+
+class BlockTimestampCache:
+    """
+        Bounded LRU of block timestamps keyed by (chain, block number), saved to a JSON file between runs
+        Block timestamps never change once a block is final, so a cached value is always good
+    """
+
+    def __init__(self, path=TIMESTAMP_CACHE_FILE, maxsize=CACHE_SIZE):
+        self.path = path
+        self.maxsize = maxsize
+        self.timestamps = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Shared by the backfill worker threads, the lock only guards the dict, never a fetch
+        self.lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def get(self, chain, block_number):
+        key = (chain, block_number)
+        with self.lock:
+            if key not in self.timestamps:
+                return None
+            self.timestamps.move_to_end(key)
+            return self.timestamps[key]
+
+    def put(self, chain, block_number, timestamp):
+        key = (chain, block_number)
+        with self.lock:
+            self.timestamps[key] = timestamp
+            self.timestamps.move_to_end(key)
+            while len(self.timestamps) > self.maxsize:
+                self.timestamps.popitem(last=False)
+
+    def fetch(self, w3, chain, block_numbers):
+        """
+            Returns {block number: timestamp} for block_numbers
+            Only the blocks that are not cached are fetched, all of them in one batch
+        """
+        result = {}
+        missing = []
+        for n in set(block_numbers):
+            timestamp = self.get(chain, n)
+            if timestamp is None:
+                missing.append(n)
+            else:
+                result[n] = timestamp
+        with self.lock:
+            self.hits += len(result)
+            self.misses += len(missing)
+        if missing:
+            missing.sort()
+            for n, block in zip(missing, fetch_blocks(w3, missing)):
+                self.put(chain, n, block['timestamp'])
+                result[n] = block['timestamp']
+        return result
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not read block timestamp cache {self.path}: {e}")
+            return
+        # Saved oldest first, so reloading keeps the LRU order
+        for chain, block_number, timestamp in saved:
+            self.put(chain, block_number, timestamp)
+
+    def save(self):
+        if self.path is None:
+            return
+        tmp_path = self.path + ".tmp"
+        with self.lock:
+            saved = [[chain, n, ts] for (chain, n), ts in self.timestamps.items()]
+        with open(tmp_path, 'w') as f:
+            json.dump(saved, f)
+        os.replace(tmp_path, self.path)
@@ -3,36 +3,128 @@ from web3.providers.rpc import HTTPProvider
 from web3.middleware import ExtraDataToPOAMiddleware #Necessary for POA chains
 from datetime import datetime
 import json
-import pandas as pd
 
 import os
 import json
 import time
+import requests
+from requests.adapters import HTTPAdapter
 from eth_account import Account
 from eth_account.signers.local import LocalAccount
 from dotenv import load_dotenv # Optional: for managing API keys if needed
+from hexbytes import HexBytes
+from web3.exceptions import TransactionNotFound
+from nonce_manager import NonceManager, is_nonce_error, is_already_known
+from relay_ledger import event_keys, PENDING, SIGNED, RETRY, SUBMITTED, UNFINISHED
+from reorg import confirmed_head
 
 # --- Configuration ---
 CONTRACT_INFO_FILE = "contract_info.json"
 SECRET_KEY_FILE = "secret_key.txt"
 SCAN_BLOCK_RANGE = 5 # Number of recent blocks to scan
+RECEIPT_TIMEOUT = 180 # Seconds to wait for a transaction receipt
+NONCE_RETRIES = 2 # Times a rejected nonce is resynced and the transaction resent
 
 
 # --- Helper Functions ---
-def connect_to(chain):
-    if chain == 'source':  # The source contract chain is avax
-        api_url = f"https://api.avax-test.network/ext/bc/C/rpc" #AVAX C-chain testnet
+RPC_URLS = {
+    'source': "https://api.avax-test.network/ext/bc/C/rpc", # The source contract chain is avax (C-chain testnet)
+    'destination': "https://data-seed-prebsc-1-s1.binance.org:8545/", # The destination contract chain is bsc (testnet)
+}
+POOL_SIZE = 10 # Keep-alive connections kept open per chain
 
-    if chain == 'destination':  # The destination contract chain is bsc
-        api_url = f"https://data-seed-prebsc-1-s1.binance.org:8545/" #BSC testnet
 
+def connect_to(chain, session=None):
+    """
+        Returns a Web3 instance for chain ('source' or 'destination')
+        session - optional requests.Session so several calls share pooled keep-alive connections
+    """
     if chain in ['source','destination']:
-        w3 = Web3(Web3.HTTPProvider(api_url))
+        api_url = RPC_URLS[chain]
+        w3 = Web3(Web3.HTTPProvider(api_url, session=session))
         # inject the poa compatibility middleware to the innermost layer
         w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
     return w3
 
 
+class ChainRegistry:
+    """
+        Shared cache of Web3 connections, contract objects and chain IDs
+        One registry is meant to be shared by scan_blocks and all the event handlers so that
+        each chain gets one pooled HTTP session, each contract ABI is parsed once and
+        chain_id is queried once per chain
+    """
+
+    def __init__(self, connect=None, pool_size=POOL_SIZE):
+        # connect - optional function mapping a chain name to a Web3 instance (e.g. a local test chain)
+        self._connect = connect
+        self.pool_size = pool_size
+        self._sessions = {}
+        self._w3s = {}
+        self._contracts = {}
+        self._chain_ids = {}
+        self.counters = {
+            'connections_created': 0, 'connection_reuses': 0,
+            'contracts_created': 0, 'contract_reuses': 0,
+            'chain_id_queries': 0, 'chain_id_reuses': 0,
+        }
+
+    def w3(self, chain):
+        if chain in self._w3s:
+            self.counters['connection_reuses'] += 1
+            return self._w3s[chain]
+        if self._connect is not None:
+            w3 = self._connect(chain)
+        else:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._sessions[chain] = session
+            w3 = connect_to(chain, session=session)
+        self._w3s[chain] = w3
+        self.counters['connections_created'] += 1
+        return w3
+
+    def contract(self, chain, contracts_info):
+        """Returns the bridge contract on chain, built from contracts_info[chain] the first time only"""
+        address = contracts_info[chain]['address']
+        key = (chain, address)
+        if key in self._contracts:
+            self.counters['contract_reuses'] += 1
+            return self._contracts[key]
+        contract = self.w3(chain).eth.contract(address=address, abi=contracts_info[chain]['abi'])
+        self._contracts[key] = contract
+        self.counters['contracts_created'] += 1
+        return contract
+
+    def chain_id(self, chain):
+        if chain in self._chain_ids:
+            self.counters['chain_id_reuses'] += 1
+            return self._chain_ids[chain]
+        chain_id = self.w3(chain).eth.chain_id
+        self._chain_ids[chain] = chain_id
+        self.counters['chain_id_queries'] += 1
+        return chain_id
+
+    def stats(self):
+        """Returns a copy of the reuse counters"""
+        return dict(self.counters)
+
+    def close(self):
+        for session in self._sessions.values():
+            session.close()
+        self._sessions.clear()
+        self._w3s.clear()
+        self._contracts.clear()
+        self._chain_ids.clear()
+
+
+# Registry and nonce manager used when callers do not pass their own
+REGISTRY = ChainRegistry()
+NONCES = NonceManager()
+
+
 def get_contract_info(chain, contract_info):
     """
         Load the contract_info file into a dictionary
@@ -64,8 +156,16 @@ def load_warden_account(secret_key_file):
         print(f"Failed to load warden account: {e}")
         raise
 
-def send_transaction(w3: Web3, account: LocalAccount, tx_params: dict):
-    """Signs and sends a transaction, waiting for the receipt."""
+def send_transaction(w3: Web3, account: LocalAccount, tx_params: dict, chain=None, nonce_manager=None, wait=True,
+                     on_signed=None):
+    """
+        Signs and sends a transaction, waiting for the receipt.
+        chain / nonce_manager - when given, the nonce comes from the local NonceManager instead of
+                                get_transaction_count, so transactions can be sent back-to-back
+        wait - if False, return the transaction hash right after sending (see wait_for_receipts)
+        on_signed - optional function(tx_hash, raw_tx, nonce) called after signing and before broadcasting,
+                    e.g. RelayLedger.mark_signed so a crash cannot lose track of a sent transaction
+    """
     try:
         # Estimate gas if not provided
         if 'gas' not in tx_params:
@@ -77,18 +177,42 @@ def send_transaction(w3: Web3, account: LocalAccount, tx_params: dict):
             tx_params['gasPrice'] = w3.eth.gas_price
             print(f"Using gas price: {tx_params['gasPrice']}")
 
-        # Get nonce
-        tx_params['nonce'] = w3.eth.get_transaction_count(account.address)
-        print(f"Using nonce: {tx_params['nonce']}")
-
-
-        signed_tx = w3.eth.account.sign_transaction(tx_params, account.key)
-        tx_hash = w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+        for attempt in range(NONCE_RETRIES + 1):
+            # Get nonce
+            if nonce_manager is not None:
+                tx_params['nonce'] = nonce_manager.next_nonce(w3, chain, account.address)
+            else:
+                tx_params['nonce'] = w3.eth.get_transaction_count(account.address)
+            print(f"Using nonce: {tx_params['nonce']}")
+
+            signed_tx = w3.eth.account.sign_transaction(tx_params, account.key)
+            raw_tx = getattr(signed_tx, 'raw_transaction', None) or signed_tx.rawTransaction
+            if on_signed is not None:
+                on_signed(Web3.keccak(raw_tx), raw_tx, tx_params['nonce'])
+            try:
+                tx_hash = w3.eth.send_raw_transaction(raw_tx)
+                break
+            except Exception as e:
+                if is_already_known(e):
+                    # An earlier send of these same bytes reached the node, its hash is the hash of the bytes
+                    tx_hash = Web3.keccak(raw_tx)
+                    break
+                if nonce_manager is None:
+                    raise
+                # The reserved nonce was not used, reload the counter from the node so later
+                # transactions neither reuse a taken nonce nor leave a gap
+                nonce_manager.resync(w3, chain, account.address)
+                if not is_nonce_error(e) or attempt == NONCE_RETRIES:
+                    raise
+                print(f"Nonce rejected ({e}), retrying")
         print(f"Transaction sent with hash: {tx_hash.hex()}")
 
+        if not wait:
+            return tx_hash
+
         # Wait for transaction receipt
         print("Waiting for transaction receipt...")
-        tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=180) # Wait up to 3 minutes
+        tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=RECEIPT_TIMEOUT) # Wait up to 3 minutes
         print(f"Transaction confirmed in block: {tx_receipt.blockNumber}")
         if tx_receipt.status == 0:
             print("Warning: Transaction failed (reverted).")
@@ -105,44 +229,131 @@ def send_transaction(w3: Web3, account: LocalAccount, tx_params: dict):
         print(f"Error sending transaction: {e}")
         raise
 
+
+def wait_for_receipts(registry, pending, ledger=None):
+    """
+        Waits for every transaction in pending, a list of (chain, tx_hash, ledger_key) sent with wait=False
+        The transactions are already in the mempool together, so this costs roughly one
+        confirmation time instead of one per transaction
+        ledger - optional RelayLedger, rows with a ledger_key are marked confirmed/failed
+        Returns a list of receipts (None for transactions that timed out)
+    """
+    receipts = []
+    for chain, tx_hash, key in pending:
+        try:
+            tx_receipt = registry.w3(chain).eth.wait_for_transaction_receipt(tx_hash, timeout=RECEIPT_TIMEOUT)
+            print(f"Transaction {tx_hash.hex()} confirmed in block: {tx_receipt.blockNumber}")
+            if tx_receipt.status == 0:
+                print(f"Warning: Transaction {tx_hash.hex()} failed (reverted).")
+        except Exception as e:
+            # Leave the ledger row as submitted, the receipt is looked up again on resume
+            print(f"Error waiting for transaction {tx_hash.hex()}: {e}")
+            tx_receipt = None
+        if ledger is not None and key is not None and tx_receipt is not None:
+            if tx_receipt.status == 0:
+                ledger.mark_failed(key, 'reverted')
+            else:
+                ledger.mark_confirmed(key)
+        receipts.append(tx_receipt)
+    return receipts
+
+
 # --- Event Handling Functions ---
 
-def handle_deposit_event(event, warden_account, contracts_info):
-    """Handles a Deposit event found on the source chain by calling wrap() on the destination."""
-    print("-" * 20)
-    print(f"Handling Deposit Event from Source (AVAX)...")
-    print(f"  Token: {event.args.token}")
-    print(f"  Recipient: {event.args.recipient}")
-    print(f"  Amount: {event.args.amount}")
-    print(f"  Tx Hash: {event.transactionHash.hex()}")
+def deposit_to_wrap(event):
+    """Maps a source Deposit event to the call relaying it: (target chain, function name, arguments)"""
+    return 'destination', 'wrap', (
+        event.args.token,      # _underlying_token (address on source chain)
+        event.args.recipient,  # _recipient (final recipient address)
+        event.args.amount      # _amount
+    )
+
+
+def unwrap_to_withdraw(event):
+    """Maps a destination Unwrap event to the call relaying it: (target chain, function name, arguments)"""
+    return 'source', 'withdraw', (
+        event.args.underlying_token, # _token (address on source chain)
+        event.args.to,               # _recipient (final recipient address on source chain)
+        event.args.amount            # _amount
+    )
+
+
+def relay_event(event, chain, to_call, warden_account, contracts_info, registry=None, nonce_manager=None, pending=None, ledger=None,
+                key=None):
+    """
+        Sends the transaction relaying event (seen on chain) to the other chain
+        to_call - deposit_to_wrap or unwrap_to_withdraw
+        pending - if a list is given the transaction is only submitted and (chain, tx_hash, ledger_key) is
+                  appended for wait_for_receipts, otherwise this waits for the receipt
+        ledger - optional RelayLedger, the event is claimed before sending and its state tracked
+        key - ledger key of event, from relay_ledger.event_keys over the events of the same get_logs call
+        Returns True if the relay was sent (or was already in the ledger), False if it failed
+    """
+    registry = registry or REGISTRY
+    nonce_manager = nonce_manager or NONCES
+    target, function_name, args = to_call(event)
+    if ledger is not None and key is None:
+        raise ValueError("relay_event needs the event's ledger key, see relay_ledger.event_keys")
+    on_signed = (lambda tx_hash, raw_tx, nonce: ledger.mark_signed(key, tx_hash, raw_tx, nonce)) if ledger is not None else None
+    if ledger is not None and not ledger.claim(key, event, chain, target, function_name, args):
+        print(f"Event {key} is already in the relay ledger, skipping")
+        return True
 
     try:
-        w3_dest = connect_to('destination')
-        dest_info = contracts_info['destination']
-        dest_contract = w3_dest.eth.contract(address=dest_info['address'], abi=dest_info['abi'])
-
-        # Prepare the wrap() transaction
-        wrap_tx = dest_contract.functions.wrap(
-            event.args.token,      # _underlying_token (address on source chain)
-            event.args.recipient,  # _recipient (final recipient address)
-            event.args.amount      # _amount
-        ).build_transaction({
+        w3_target = registry.w3(target)
+        target_contract = registry.contract(target, contracts_info)
+
+        # Prepare the relay transaction
+        relay_tx = target_contract.functions[function_name](*args).build_transaction({
             'from': warden_account.address,
-            'chainId': w3_dest.eth.chain_id,
+            'chainId': registry.chain_id(target),
             # Gas and Nonce will be handled by send_transaction
         })
 
-        print(f"Sending wrap transaction to Destination (BSC) contract: {dest_info['address']}")
-        send_transaction(w3_dest, warden_account, wrap_tx)
-        print("wrap() transaction successful.")
+        print(f"Sending {function_name} transaction to {target.capitalize()} contract: {contracts_info[target]['address']}")
+        tx_hash = send_transaction(w3_target, warden_account, relay_tx, target, nonce_manager, wait=False, on_signed=on_signed)
+        if ledger is not None:
+            ledger.mark_submitted(key, tx_hash)
+        if pending is None:
+            wait_for_receipts(registry, [(target, tx_hash, key)], ledger)
+            print(f"{function_name}() transaction successful.")
+        else:
+            # Pipelined: the caller waits for all receipts at the end
+            pending.append((target, tx_hash, key))
+            print(f"{function_name}() transaction submitted.")
+        return True
 
     except Exception as e:
-        print(f"Error handling Deposit event and calling wrap(): {e}")
+        # A SIGNED row stays as it is, its transaction may have reached the node before the error
+        if ledger is not None and ledger.state(key) == PENDING:
+            ledger.mark_error(key, e)
+        event_name = 'Deposit' if chain == 'source' else 'Unwrap'
+        print(f"Error handling {event_name} event and calling {function_name}(): {e}")
+        return False
+
+
+def handle_deposit_event(event, warden_account, contracts_info, registry=None, nonce_manager=None, pending=None, ledger=None,
+                         key=None):
+    """Handles a Deposit event found on the source chain by calling wrap() on the destination. Returns False if the relay failed"""
+    if ledger is not None and ledger.seen(key):
+        # A relay still waiting for a retry is not done yet (resume_unfinished sends it)
+        return ledger.state(key) not in (PENDING, SIGNED, RETRY)
+    print("-" * 20)
+    print(f"Handling Deposit Event from Source (AVAX)...")
+    print(f"  Token: {event.args.token}")
+    print(f"  Recipient: {event.args.recipient}")
+    print(f"  Amount: {event.args.amount}")
+    print(f"  Tx Hash: {event.transactionHash.hex()}")
+    relayed = relay_event(event, 'source', deposit_to_wrap, warden_account, contracts_info, registry, nonce_manager, pending, ledger, key)
     print("-" * 20)
+    return relayed
 
 
-def handle_unwrap_event(event, warden_account, contracts_info):
-    """Handles an Unwrap event found on the destination chain by calling withdraw() on the source."""
+def handle_unwrap_event(event, warden_account, contracts_info, registry=None, nonce_manager=None, pending=None, ledger=None,
+                        key=None):
+    """Handles an Unwrap event found on the destination chain by calling withdraw() on the source. Returns False if the relay failed"""
+    if ledger is not None and ledger.seen(key):
+        return ledger.state(key) not in (PENDING, SIGNED, RETRY)
     print("-" * 20)
     print(f"Handling Unwrap Event from Destination (BSC)...")
     print(f"  Underlying Token: {event.args.underlying_token}")
@@ -151,42 +362,102 @@ def handle_unwrap_event(event, warden_account, contracts_info):
     print(f"  To (Recipient): {event.args.to}") # This is the recipient on the source chain
     print(f"  Amount: {event.args.amount}")
     print(f"  Tx Hash: {event.transactionHash.hex()}")
+    relayed = relay_event(event, 'destination', unwrap_to_withdraw, warden_account, contracts_info, registry, nonce_manager, pending, ledger, key)
+    print("-" * 20)
+    return relayed
 
-    try:
-        w3_source = connect_to('source')
-        source_info = contracts_info['source']
-        source_contract = w3_source.eth.contract(address=source_info['address'], abi=source_info['abi'])
-
-        # Prepare the withdraw() transaction
-        withdraw_tx = source_contract.functions.withdraw(
-            event.args.underlying_token, # _token (address on source chain)
-            event.args.to,               # _recipient (final recipient address on source chain)
-            event.args.amount            # _amount
-        ).build_transaction({
-            'from': warden_account.address,
-            'chainId': w3_source.eth.chain_id,
-            # Gas and Nonce will be handled by send_transaction
-        })
-
-        print(f"Sending withdraw transaction to Source (AVAX) contract: {source_info['address']}")
-        send_transaction(w3_source, warden_account, withdraw_tx)
-        print("withdraw() transaction successful.")
 
+def rebroadcast(w3, row):
+    """
+        Sends the signed transaction stored in a SIGNED ledger row again, byte for byte
+        Returns its hash, or None if it can never be mined because another transaction used its nonce
+    """
+    tx_hash = HexBytes(row['relay_tx'])
+    try:
+        w3.eth.send_raw_transaction(HexBytes(row['raw_tx']))
     except Exception as e:
-        print(f"Error handling Unwrap event and calling withdraw(): {e}")
-    print("-" * 20)
+        if is_already_known(e):
+            return tx_hash
+        if not is_nonce_error(e):
+            raise
+        # The nonce is used: either by this very transaction (it was mined) or by another one
+        try:
+            w3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            return None
+    return tx_hash
+
+
+def resume_unfinished(ledger, warden_account, contracts_info, registry=None, nonce_manager=None, states=UNFINISHED,
+                      due_only=False):
+    """
+        Finishes the relays a crashed run left in the ledger without rescanning any blocks
+        SUBMITTED rows only have their receipt looked up, SIGNED rows have their stored transaction sent
+        again unchanged, PENDING and RETRY rows (never signed) are built and sent from the stored arguments
+        states - only resume rows in these states, e.g. (SIGNED, RETRY) to finish failed sends between scans
+        due_only - skip RETRY rows still backing off (see RelayLedger.unfinished)
+    """
+    registry = registry or REGISTRY
+    nonce_manager = nonce_manager or NONCES
+    unfinished = ledger.unfinished(states, due_only)
+    if unfinished:
+        print(f"Resuming {len(unfinished)} unfinished relay(s) from the ledger")
+    pending = []
+    for row in unfinished:
+        target, key = row['target_chain'], row['key']
+        if row['state'] == SUBMITTED:
+            pending.append((target, HexBytes(row['relay_tx']), key))
+            continue
+        if row['state'] == SIGNED:
+            try:
+                tx_hash = rebroadcast(registry.w3(target), row)
+            except Exception as e:
+                # Left SIGNED, the same bytes are tried again on the next resume
+                print(f"Error rebroadcasting {row['function_name']}() for {key}: {e}")
+                continue
+            if tx_hash is not None:
+                ledger.mark_submitted(key, tx_hash)
+                pending.append((target, tx_hash, key))
+                continue
+            print(f"Nonce {row['nonce']} of the stored {row['function_name']}() for {key} was used by another transaction, signing it again")
+        try:
+            relay_tx = registry.contract(target, contracts_info).functions[row['function_name']](*row['args']).build_transaction({
+                'from': warden_account.address,
+                'chainId': registry.chain_id(target),
+            })
+            tx_hash = send_transaction(registry.w3(target), warden_account, relay_tx, target, nonce_manager, wait=False,
+                                       on_signed=lambda tx_hash, raw_tx, nonce: ledger.mark_signed(key, tx_hash, raw_tx, nonce))
+            ledger.mark_submitted(key, tx_hash)
+            pending.append((target, tx_hash, key))
+        except Exception as e:
+            print(f"Error resending {row['function_name']}() for {key}: {e}")
+            if ledger.state(key) != SIGNED:
+                ledger.mark_error(key, e)
+    return wait_for_receipts(registry, pending, ledger)
 
 
 
 
 # --- Main Scanning Function ---    
-def scan_blocks(chain, contracts_info, warden_account):
+def scan_blocks(chain, contracts_info, warden_account, start_block=None, end_block=None, registry=None, nonce_manager=None,
+                ledger=None):
     """
         chain - (string) should be either "source" or "destination"
         Scan the last 5 blocks of the source and destination chains
         Look for 'Deposit' events on the source chain and 'Unwrap' events on the destination chain
         When Deposit events are found on the source chain, call the 'wrap' function the destination chain
         When Unwrap events are found on the destination chain, call the 'withdraw' function on the source chain
+
+        start_block / end_block - optional explicit range (used by the warden in warden.py),
+        defaults to the last SCAN_BLOCK_RANGE confirmed blocks (see reorg.CONFIRMATIONS)
+        registry - optional ChainRegistry shared with the event handlers (defaults to REGISTRY)
+        nonce_manager - optional NonceManager (defaults to NONCES), all transactions for the window
+                        are sent back-to-back and their receipts are awaited at the end
+        ledger - optional RelayLedger, events already in it are skipped
+        Returns the last block whose events were all relayed: end_block, or the block before the first
+        event whose relay failed (no later event is sent; with a ledger a rescan from there skips the events
+        already relayed, without one the failed block's earlier events are relayed again), or None if the
+        scan itself failed
     """
 
     # This is different from Bridge IV where chain was "avax" or "bsc"
@@ -198,56 +469,72 @@ def scan_blocks(chain, contracts_info, warden_account):
     
     print(f"\n=== Scanning {chain.upper()} Chain ===")
     try:
-        w3 = connect_to(chain)
-        chain_info = contracts_info[chain]
-        contract_address = chain_info['address']
-        contract_abi = chain_info['abi']
-        contract = w3.eth.contract(address=contract_address, abi=contract_abi)
+        registry = registry or REGISTRY
+        nonce_manager = nonce_manager or NONCES
+        w3 = registry.w3(chain)
+        pending = []
+        contract_address = contracts_info[chain]['address']
+        contract = registry.contract(chain, contracts_info)
 
         # Determine block range to scan
-        latest_block = w3.eth.get_block_number()
-        start_block = max(0, latest_block - SCAN_BLOCK_RANGE + 1) # Ensure start_block is not negative
-        end_block = latest_block
+        if end_block is None:
+            end_block = confirmed_head(w3, chain)
+        if start_block is None:
+            start_block = max(0, end_block - SCAN_BLOCK_RANGE + 1) # Ensure start_block is not negative
 
         print(f"Scanning blocks {start_block} to {end_block} on {chain} for contract {contract_address}")
+        scanned = end_block
 
         if chain == 'source':
             # Listen for 'Deposit' events on the Source contract
             try:
-                event_filter = contract.events.Deposit.create_filter(
-                    fromBlock=start_block,
-                    toBlock=end_block
+                # get_logs is a single eth_getLogs call, no filter has to be installed on the node
+                events = contract.events.Deposit().get_logs(
+                    from_block=start_block,
+                    to_block=end_block
                 )
-                events = event_filter.get_all_entries()
                 print(f"Found {len(events)} Deposit event(s).")
-                for event in events:
+                for event, key in zip(events, event_keys(events)):
                     # Process each Deposit event
-                    handle_deposit_event(event, warden_account, contracts_info)
+                    if not handle_deposit_event(event, warden_account, contracts_info, registry, nonce_manager, pending, ledger, key):
+                        scanned = event.blockNumber - 1
+                        break
             except Exception as e:
                  # Might happen if the event isn't defined correctly in the ABI
                 print(f"Error creating/fetching Deposit event filter on {chain}: {e}")
+                return None
 
 
         elif chain == 'destination':
             # Listen for 'Unwrap' events on the Destination contract
             try:
-                event_filter = contract.events.Unwrap.create_filter(
-                    fromBlock=start_block,
-                    toBlock=end_block
+                events = contract.events.Unwrap().get_logs(
+                    from_block=start_block,
+                    to_block=end_block
                 )
-                events = event_filter.get_all_entries()
                 print(f"Found {len(events)} Unwrap event(s).")
-                for event in events:
+                for event, key in zip(events, event_keys(events)):
                     # Process each Unwrap event
-                    handle_unwrap_event(event, warden_account, contracts_info)
+                    if not handle_unwrap_event(event, warden_account, contracts_info, registry, nonce_manager, pending, ledger, key):
+                        scanned = event.blockNumber - 1
+                        break
             except Exception as e:
                 # Might happen if the event isn't defined correctly in the ABI
                 print(f"Error creating/fetching Unwrap event filter on {chain}: {e}")
+                return None
+
+        if pending:
+            print(f"Waiting for {len(pending)} receipt(s)...")
+            wait_for_receipts(registry, pending, ledger)
+        if scanned < end_block:
+            print(f"Relay failed in block {scanned + 1}, {chain} scanned up to block {scanned} only")
+        return scanned
 
     except ConnectionError as e:
         print(f"Connection error while scanning {chain}: {e}")
     except Exception as e:
         print(f"An unexpected error occurred while scanning {chain}: {e}")
+    return None
 
 
 # --- Main Execution ---
@@ -272,6 +559,8 @@ if __name__ == "__main__":
         # 3. Scan Destination Chain (BSC) for Unwraps
         scan_blocks('destination', all_contract_info, warden)
 
+        print(f"Connection reuse: {REGISTRY.stats()}")
+
         print("\nBridge Listener Script Finished.")
 
     except (FileNotFoundError, ValueError, ConnectionError) as e:
@@ -0,0 +1,161 @@
+"""
+	Bulk reads of the Merkle prime contract, the calls reading_the_chain.get_contract_values makes one
+	eth_call at a time (merkleRoot, DEFAULT_ADMIN_ROLE, hasRole, getPrimeByOwner) for any number of
+	admins and owners
+
+	Calls are packed into Multicall3 aggregate3 calls (one eth_call per CALLS_PER_REQUEST calls) where
+	Multicall3 is deployed, and into JSON-RPC batches otherwise. DEFAULT_ADMIN_ROLE never changes, so it
+	is read once per contract (chain ID and address) and cached
+"""
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11" # Same address on nearly every EVM chain
+MULTICALL3_ABI = [{
+	"inputs": [{"components": [
+		{"internalType": "address", "name": "target", "type": "address"},
+		{"internalType": "bool", "name": "allowFailure", "type": "bool"},
+		{"internalType": "bytes", "name": "callData", "type": "bytes"}],
+		"internalType": "struct Multicall3.Call3[]", "name": "calls", "type": "tuple[]"}],
+	"name": "aggregate3",
+	"outputs": [{"components": [
+		{"internalType": "bool", "name": "success", "type": "bool"},
+		{"internalType": "bytes", "name": "returnData", "type": "bytes"}],
+		"internalType": "struct Multicall3.Result[]", "name": "returnData", "type": "tuple[]"}],
+	"stateMutability": "payable", "type": "function"
+}]
+CALLS_PER_REQUEST = 500 # Calls per aggregate3 call or JSON-RPC batch
+CONSTANT_FUNCTIONS = ('DEFAULT_ADMIN_ROLE',)
+
+# Constant return values, per (chain ID, contract address), shared by every ContractReader
+CONSTANTS = {}
+
+
+class ContractReader:
+	"""
+	mode - 'multicall', 'batch', 'sequential' (one eth_call per call, what get_contract_values did),
+	       or 'auto': multicall if Multicall3 has code on the chain, batch otherwise
+	"""
+
+	def __init__(self, w3, contract, mode='auto', calls_per_request=CALLS_PER_REQUEST):
+		self.w3 = w3
+		self.contract = contract
+		self.calls_per_request = calls_per_request
+		self.requests = 0 # Round trips made, for reporting
+		if mode == 'auto':
+			self.requests += 1
+			mode = 'multicall' if len(w3.eth.get_code(MULTICALL3_ADDRESS)) > 0 else 'batch'
+		if mode not in ('multicall', 'batch', 'sequential'):
+			raise ValueError(f"Unknown read mode: {mode}")
+		self.mode = mode
+		# The same address on another chain is another contract
+		self.requests += 1
+		self.constants = CONSTANTS.setdefault((w3.eth.chain_id, contract.address), {})
+
+	def call_many(self, calls):
+		"""
+		calls - list of (function name, args)
+		Returns the results in the same order, None for a call that failed (reverted or not in the ABI)
+		"""
+		results = []
+		for i in range(0, len(calls), self.calls_per_request):
+			chunk = calls[i:i + self.calls_per_request]
+			if self.mode == 'multicall':
+				results.extend(self.multicall(chunk))
+			elif self.mode == 'batch':
+				results.extend(self.batch(chunk))
+			else:
+				results.extend(self.sequential(chunk))
+		return results
+
+	def function(self, name, args):
+		return self.contract.get_function_by_name(name)(*args)
+
+	def sequential(self, calls):
+		results = []
+		for name, args in calls:
+			self.requests += 1
+			try:
+				results.append(self.function(name, args).call())
+			except Exception as e:
+				print(f"Error calling {name}{tuple(args)}: {e}")
+				results.append(None)
+		return results
+
+	def batch(self, calls):
+		functions = []
+		for name, args in calls:
+			try:
+				functions.append(self.function(name, args))
+			except Exception as e:
+				print(f"Error encoding {name}{tuple(args)}: {e}")
+				functions.append(None)
+		try:
+			self.requests += 1
+			with self.w3.batch_requests() as batch:
+				for fn in functions:
+					if fn is not None:
+						batch.add(fn)
+				responses = iter(batch.execute())
+		except Exception as e:
+			# One bad call fails the whole batch on some providers, the calls are then made one by one
+			print(f"Batch call failed ({e}), calling {len(calls)} function(s) one by one")
+			return self.sequential(calls)
+		return [next(responses) if fn is not None else None for fn in functions]
+
+	def multicall(self, calls):
+		multicall = self.w3.eth.contract(address=MULTICALL3_ADDRESS, abi=MULTICALL3_ABI)
+		encoded = []
+		for name, args in calls:
+			try:
+				encoded.append((name, self.contract.encode_abi(name, args=list(args))))
+			except Exception as e:
+				print(f"Error encoding {name}{tuple(args)}: {e}")
+				encoded.append((name, None))
+		self.requests += 1
+		returned = iter(multicall.functions.aggregate3(
+			[(self.contract.address, True, data) for _, data in encoded if data is not None]
+		).call())
+		results = []
+		for name, data in encoded:
+			if data is None:
+				results.append(None)
+				continue
+			success, return_data = next(returned)
+			if not success:
+				print(f"Call to {name} reverted")
+				results.append(None)
+				continue
+			outputs = self.contract.get_function_by_name(name).abi['outputs']
+			values = self.w3.codec.decode([o['type'] for o in outputs], return_data)
+			results.append(values[0] if len(values) == 1 else values)
+		return results
+
+	def constant(self, name):
+		"""Return value of a function that never changes, read once per contract"""
+		if name not in self.constants:
+			value, = self.call_many([(name, ())])
+			if value is None:
+				return None
+			self.constants[name] = value
+		return self.constants[name]
+
+	def read_values(self, admin_addresses, owner_addresses):
+		"""
+		Returns (merkle root, {admin: has DEFAULT_ADMIN_ROLE}, {owner: prime owned or None})
+		in one aggregate/batch per CALLS_PER_REQUEST calls (plus one the first time, for DEFAULT_ADMIN_ROLE)
+		"""
+		admin_addresses = list(admin_addresses)
+		owner_addresses = list(owner_addresses)
+		role = self.constant('DEFAULT_ADMIN_ROLE')
+		calls = [('merkleRoot', ())]
+		if role is not None:
+			calls += [('hasRole', (role, admin)) for admin in admin_addresses]
+		calls += [('getPrimeByOwner', (owner,)) for owner in owner_addresses]
+		results = self.call_many(calls)
+
+		root = results[0]
+		if role is None:
+			has_role = {admin: False for admin in admin_addresses}
+			prime_results = results[1:]
+		else:
+			has_role = {admin: bool(ok) for admin, ok in zip(admin_addresses, results[1:1 + len(admin_addresses)])}
+			prime_results = results[1 + len(admin_addresses):]
+		return root, has_role, dict(zip(owner_addresses, prime_results))
@@ -0,0 +1,175 @@
+import csv
+import json
+import os
+
+COLUMNS = ['chain', 'token', 'recipient', 'amount', 'transactionHash', 'address', 'date']
+CHECKPOINT_BLOCKS = 1000 # Flush and checkpoint at least this often (in blocks scanned)
+CHECKPOINT_ROWS = 5000 # ... or once this many rows were written since the last checkpoint
+CHECKPOINT_HISTORY = 8 # Earlier checkpoints kept to fall back on if the newest one was reorged out
+
+
+class DepositWriter:
+    """
+        Streams Deposit rows to eventfile chunk by chunk instead of holding them all in memory
+        At checkpoint boundaries the CSV is flushed to disk and <eventfile>.checkpoint records the last
+        fully scanned block and the CSV size at that point, so an interrupted scan can resume:
+        anything written after the checkpoint is truncated away and scanning restarts after its block
+
+        columnar - optional 'parquet', also writes the rows as a directory of Parquet files
+                   (one file per checkpoint, needs pyarrow)
+        block_hash - optional function returning the hash of a block number, checkpoints then record the
+                     hash of their block and resume falls back to the newest checkpoint still on the chain
+    """
+
+    def __init__(self, eventfile, scan_id, resume=False, columnar=None, block_hash=None):
+        # scan_id - identifies the scan (chain, contract, start block), a checkpoint is only reused for the same scan
+        self.eventfile = eventfile
+        self.checkpoint_file = eventfile + ".checkpoint"
+        self.scan_id = scan_id
+        self.columnar = columnar
+        self.block_hash = block_hash
+        self.history = []
+        self.parquet_dir = os.path.splitext(eventfile)[0] + ".parquet"
+        self.f = None
+        self.writer = None
+        self.offset = 0
+        self.rows = 0
+        self.parts = 0
+        self.last_block = None
+        self.blocks_since_checkpoint = 0
+        self.pending_rows = []
+        self.rows_since_checkpoint = 0
+        # Rows of the chunk being written, only counted once chunk_done() is called
+        self.chunk_rows = []
+
+        if columnar not in (None, 'parquet'):
+            raise ValueError(f"Unsupported columnar format: {columnar}")
+
+        saved = self.read_checkpoint() if resume else None
+        if saved is not None:
+            saved = self.newest_valid_checkpoint(saved)
+        if saved is not None:
+            self.last_block = saved['last_block']
+            self.offset = saved['offset']
+            self.rows = saved['rows']
+            self.parts = saved.get('parts', 0)
+            # Drop whatever was written after the checkpoint, it will be scanned again
+            if os.path.exists(self.eventfile):
+                with open(self.eventfile, 'r+') as f:
+                    f.truncate(self.offset)
+            self.remove_parts_from(self.parts)
+            print(f"Resuming {eventfile} after block {self.last_block} ({self.rows} rows kept)")
+        else:
+            for path in (self.eventfile, self.checkpoint_file):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.remove_parts_from(0)
+
+    def read_checkpoint(self):
+        if not os.path.exists(self.checkpoint_file):
+            return None
+        with open(self.checkpoint_file, 'r') as f:
+            saved = json.load(f)
+        if saved.get('scan_id') != list(self.scan_id):
+            print(f"Ignoring {self.checkpoint_file}, it belongs to a different scan")
+            return None
+        return saved
+
+    def newest_valid_checkpoint(self, saved):
+        """Returns the newest saved checkpoint whose block hash still matches the chain, or None"""
+        history = [saved] + saved.get('history', [])
+        for i, checkpoint in enumerate(history):
+            if (self.block_hash is None or checkpoint.get('hash') is None
+                    or bytes(self.block_hash(checkpoint['last_block'])).hex() == checkpoint['hash']):
+                if i > 0:
+                    print(f"Block {history[0]['last_block']} was reorged out, rolling back to block {checkpoint['last_block']}")
+                self.history = history[i + 1:]
+                return checkpoint
+        print("No saved checkpoint is on the chain any more, starting over")
+        return None
+
+    def resume_block(self):
+        """First block still to be scanned, or None if there is nothing to resume"""
+        return None if self.last_block is None else self.last_block + 1
+
+    def write_rows(self, rows):
+        if not rows:
+            return
+        if self.f is None:
+            new_file = not os.path.exists(self.eventfile) or os.path.getsize(self.eventfile) == 0
+            self.f = open(self.eventfile, 'a', newline='')
+            self.writer = csv.DictWriter(self.f, fieldnames=COLUMNS)
+            if new_file:
+                self.writer.writeheader()
+        self.writer.writerows(rows)
+        self.chunk_rows.extend(rows)
+
+    def rows_done(self):
+        """
+            Counts the rows written since the last call as complete
+            chunk_done does this for scans that go block by block, a writer fed some other way (the backfill
+            writes whole shards as they finish) calls this instead and has no block to checkpoint
+        """
+        self.rows += len(self.chunk_rows)
+        self.rows_since_checkpoint += len(self.chunk_rows)
+        if self.columnar:
+            self.pending_rows.extend(self.chunk_rows)
+        self.chunk_rows = []
+        if self.f is not None:
+            # Rows of a chunk that never finished lie past this offset and are dropped on resume
+            self.offset = self.f.tell()
+
+    def chunk_done(self, from_block, to_block):
+        """Call after every row of from_block..to_block was written, checkpoints when due"""
+        self.last_block = to_block
+        self.rows_done()
+        self.blocks_since_checkpoint += to_block - from_block + 1
+        if self.blocks_since_checkpoint >= CHECKPOINT_BLOCKS or self.rows_since_checkpoint >= CHECKPOINT_ROWS:
+            self.checkpoint()
+
+    def checkpoint(self):
+        if self.last_block is None:
+            return
+        if self.f is not None:
+            self.f.flush()
+            os.fsync(self.f.fileno())
+        if self.pending_rows:
+            self.write_parquet_part(self.pending_rows)
+            self.pending_rows = []
+        checkpoint = {'last_block': self.last_block, 'offset': self.offset, 'rows': self.rows, 'parts': self.parts,
+                      'hash': bytes(self.block_hash(self.last_block)).hex() if self.block_hash else None}
+        tmp_path = self.checkpoint_file + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(dict(checkpoint, scan_id=list(self.scan_id), history=self.history), f)
+        os.replace(tmp_path, self.checkpoint_file)
+        self.history = ([checkpoint] + self.history)[:CHECKPOINT_HISTORY]
+        self.blocks_since_checkpoint = 0
+        self.rows_since_checkpoint = 0
+
+    def write_parquet_part(self, rows):
+        # Imported here so pyarrow is only needed when columnar output is asked for
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        # amount is a uint256, too wide for any Arrow integer type, so it is kept as a decimal string
+        table = pa.table({c: [str(r[c]) if c == 'amount' else r[c] for r in rows] for c in COLUMNS})
+        os.makedirs(self.parquet_dir, exist_ok=True)
+        pq.write_table(table, os.path.join(self.parquet_dir, f"part-{self.parts:05d}.parquet"))
+        self.parts += 1
+
+    def remove_parts_from(self, first_part):
+        if not os.path.isdir(self.parquet_dir):
+            return
+        for name in os.listdir(self.parquet_dir):
+            if name.startswith("part-") and int(name[5:10]) >= first_part:
+                os.remove(os.path.join(self.parquet_dir, name))
+
+    def close(self):
+        """Final checkpoint, the scan can still be extended with resume=True"""
+        self.checkpoint()
+        if self.pending_rows:
+            # Only a writer without blocks (see rows_done) gets here, it never checkpoints
+            self.write_parquet_part(self.pending_rows)
+            self.pending_rows = []
+        if self.f is not None:
+            self.f.close()
+            self.f = None
@@ -0,0 +1,250 @@
+"""
+	Fee-market dataset: one row per transaction with its block, index, type, base fee, effective priority
+	fee (block_analytics.priority_fee, the rule is_ordered_block uses) and gas used
+
+	The dataset is a directory with one binary file per column of fixed-width integers (array typecodes,
+	little-endian) and meta.json. Rows are appended as blocks arrive, and meta.json doubles as a checkpoint:
+	an export interrupted mid-way resumes after the last block it recorded. NumPy maps the columns
+	straight into arrays, so quantiles and the ordered share over millions of transactions are a few
+	vectorized operations
+
+	python fee_dataset.py export 19000000 19010000 --out fees
+	python fee_dataset.py summary fees
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from block_analytics import priority_fee, tx_type, load_fixture, BATCH_SIZE, WORKERS
+from block_cache import fetch_blocks
+
+# (column, array typecode, NumPy dtype)
+COLUMNS = [
+	('block', 'Q', '<u8'),
+	('index', 'I', '<u4'),
+	('type', 'B', 'u1'),
+	('base_fee', 'Q', '<u8'),
+	('priority_fee', 'Q', '<u8'),
+	('gas_used', 'Q', '<u8'),
+]
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9, 0.99)
+MAX_FEE = 2 ** 64 - 1 # Largest priority fee a column holds, larger ones are stored as this
+
+
+def fetch_receipts(w3, block_numbers, batch_size=BATCH_SIZE):
+	"""Receipts of every transaction of block_numbers (eth_getBlockReceipts), batched like fetch_blocks"""
+	block_numbers = list(block_numbers)
+	receipts = []
+	for i in range(0, len(block_numbers), batch_size):
+		chunk = block_numbers[i:i + batch_size]
+		try:
+			with w3.batch_requests() as batch:
+				for n in chunk:
+					batch.add(w3.eth.get_block_receipts(n))
+				receipts.extend(batch.execute())
+		except Exception as e:
+			print(f"Batch request failed ({e}), fetching receipts of {len(chunk)} block(s) one by one")
+			receipts.extend(w3.eth.get_block_receipts(n) for n in chunk)
+	return receipts
+
+
+def rpc_fetcher(w3, batch_size=BATCH_SIZE):
+	"""fetch function for export: (block, receipts) pairs from a node"""
+	def fetch(block_numbers):
+		blocks = fetch_blocks(w3, block_numbers, batch_size, full_transactions=True)
+		return list(zip(blocks, fetch_receipts(w3, block_numbers, batch_size)))
+	return fetch
+
+
+def fixture_fetcher(path):
+	"""
+	fetch function for export replaying block_analytics fixtures
+	Receipts are taken from a 'receipts' list recorded with the block, gas_used is 0 without one
+	"""
+	blocks = load_fixture(path)
+	return lambda block_numbers: [(blocks[n], blocks[n].get('receipts')) for n in block_numbers]
+
+
+class FeeDatasetWriter:
+	def __init__(self, path, resume=False):
+		self.path = path
+		self.meta_file = os.path.join(path, "meta.json")
+		self.rows = 0
+		self.blocks = 0
+		self.last_block = None
+		self.columns = {name: array(typecode) for name, typecode, _ in COLUMNS}
+		os.makedirs(path, exist_ok=True)
+
+		meta = read_meta(path) if resume and os.path.exists(self.meta_file) else None
+		if meta is not None and [(c['name'], c['typecode']) for c in meta['columns']] != [(n, t) for n, t, _ in COLUMNS]:
+			print(f"Ignoring {self.meta_file}, it was written with other column types")
+			meta = None
+		if meta is not None:
+			self.rows = meta['rows']
+			self.blocks = meta.get('blocks', 0)
+			self.last_block = meta['last_block']
+			print(f"Resuming {path} after block {self.last_block} ({self.rows} rows kept)")
+		for name, typecode, _ in COLUMNS:
+			column_file = self.column_file(name)
+			# Rows written after the last checkpoint are dropped, their blocks are exported again
+			with open(column_file, 'r+b' if meta is not None and os.path.exists(column_file) else 'wb') as f:
+				f.truncate(self.rows * array(typecode).itemsize)
+
+	def column_file(self, name):
+		return os.path.join(self.path, f"{name}.bin")
+
+	def resume_block(self):
+		return None if self.last_block is None else self.last_block + 1
+
+	def add_block(self, block, receipts=None):
+		base_fee = block.get('baseFeePerGas') or 0
+		gas_used = {r['transactionIndex']: r['gasUsed'] for r in receipts} if receipts else {}
+		c = self.columns
+		for i, tx in enumerate(block['transactions']):
+			c['block'].append(block['number'])
+			c['index'].append(i)
+			c['type'].append(tx_type(tx))
+			c['base_fee'].append(base_fee)
+			# A valid block has no negative priority fee, and none that reaches 2^64 wei
+			c['priority_fee'].append(min(max(priority_fee(tx, base_fee), 0), MAX_FEE))
+			c['gas_used'].append(gas_used.get(i, 0))
+		# Empty blocks add no row but still count, they are ordered like in block_analytics
+		self.blocks += 1
+		self.last_block = block['number']
+
+	def checkpoint(self):
+		"""Appends the buffered rows to the column files, then records them in meta.json"""
+		added = len(self.columns['block'])
+		for name, typecode, _ in COLUMNS:
+			column = self.columns[name]
+			if sys.byteorder == 'big':
+				column.byteswap()
+			with open(self.column_file(name), 'ab') as f:
+				column.tofile(f)
+				f.flush()
+				os.fsync(f.fileno())
+			self.columns[name] = array(typecode)
+		self.rows += added
+		meta = {
+			'rows': self.rows,
+			'blocks': self.blocks,
+			'last_block': self.last_block,
+			'columns': [{'name': name, 'typecode': typecode, 'dtype': dtype} for name, typecode, dtype in COLUMNS],
+		}
+		tmp_path = self.meta_file + ".tmp"
+		with open(tmp_path, 'w') as f:
+			json.dump(meta, f)
+		os.replace(tmp_path, self.meta_file)
+
+
+def read_meta(path):
+	with open(os.path.join(path, "meta.json"), 'r') as f:
+		return json.load(f)
+
+
+def export(fetch, start_block, end_block, path, batch_size=BATCH_SIZE, workers=WORKERS, resume=False):
+	"""
+	Exports blocks start_block..end_block (inclusive) to the dataset at path, checkpointing after every
+	`workers` batches. Returns the number of rows in the dataset
+	"""
+	writer = FeeDatasetWriter(path, resume=resume)
+	if writer.resume_block() is not None:
+		start_block = max(start_block, writer.resume_block())
+	batches = [list(range(n, min(end_block, n + batch_size - 1) + 1)) for n in range(start_block, end_block + 1, batch_size)]
+	with ThreadPoolExecutor(max_workers=workers) as pool:
+		for i in range(0, len(batches), workers):
+			for pairs in pool.map(fetch, batches[i:i + workers]):
+				for block, receipts in pairs:
+					writer.add_block(block, receipts)
+			writer.checkpoint()
+	return writer.rows
+
+
+def load_columns(path):
+	"""The dataset as {column: NumPy array}, memory-mapped so only the pages used are read"""
+	# Imported here so exporting works without NumPy
+	import numpy as np
+	meta = read_meta(path)
+	columns = {}
+	for column in meta['columns']:
+		if meta['rows'] == 0:
+			columns[column['name']] = np.zeros(0, dtype=column['dtype'])
+		else:
+			columns[column['name']] = np.memmap(os.path.join(path, f"{column['name']}.bin"), dtype=column['dtype'],
+												mode='r', shape=(meta['rows'],))
+	return columns
+
+
+def summarize(path):
+	"""Fee statistics of the dataset, all vectorized"""
+	import numpy as np
+	c = load_columns(path)
+	rows = len(c['block'])
+	block = c['block']
+	# Datasets written before empty blocks were counted only know the blocks with transactions
+	blocks = read_meta(path).get('blocks') or len(np.unique(block))
+	if rows == 0:
+		return {'transactions': 0, 'blocks': blocks, 'ordered_share': 1.0 if blocks else None}
+	fee = c['priority_fee']
+	gas = c['gas_used']
+	# A block is out of order if some transaction pays a higher priority fee than the one before it
+	same_block = block[1:] == block[:-1]
+	inversion = same_block & (fee[1:] > fee[:-1])
+	unordered = np.unique(block[1:][inversion])
+	starts = np.flatnonzero(np.r_[True, ~same_block])
+	multi_tx = int(np.count_nonzero(np.diff(np.r_[starts, rows]) > 1))
+	total_gas = int(gas.sum())
+	return {
+		'transactions': rows,
+		'blocks': blocks,
+		# Same denominator as block_analytics.summarize, empty blocks count as ordered
+		'ordered_share': 1 - len(unordered) / blocks,
+		'ordered_share_multi_tx': 1 - len(unordered) / multi_tx if multi_tx else None,
+		'priority_fee_quantiles': {str(q): float(v) for q, v in zip(QUANTILES, np.quantile(fee, QUANTILES))},
+		'base_fee_median': float(np.median(c['base_fee'])),
+		'type_share': {int(t): int(n) / rows for t, n in zip(*np.unique(c['type'], return_counts=True))},
+		'gas_used': total_gas,
+		'gas_weighted_priority_fee': float(np.average(fee, weights=gas)) if total_gas else None,
+	}
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	commands = parser.add_subparsers(dest='command', required=True)
+
+	p = commands.add_parser('export', help="export a block range to a dataset directory")
+	p.add_argument('start', type=int, nargs='?')
+	p.add_argument('end', type=int, nargs='?')
+	p.add_argument('--out', default="fee_dataset")
+	p.add_argument('--fixture', help="replay blocks recorded by block_analytics.py instead of a node")
+	p.add_argument('--resume', action='store_true', help="continue an interrupted export of the same directory")
+	p.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+	p.add_argument('--workers', type=int, default=WORKERS)
+
+	p = commands.add_parser('summary', help="fee statistics of a dataset directory (needs numpy)")
+	p.add_argument('path')
+	args = parser.parse_args()
+
+	if args.command == 'summary':
+		print(json.dumps(summarize(args.path), indent=2))
+		sys.exit(0)
+
+	if args.fixture:
+		fetch = fixture_fetcher(args.fixture)
+		recorded = sorted(load_fixture(args.fixture))
+		start_block = args.start if args.start is not None else recorded[0]
+		end_block = args.end if args.end is not None else recorded[-1]
+	else:
+		if args.start is None or args.end is None:
+			parser.error("a block range is needed unless --fixture is given")
+		from reading_the_chain import connect_to_eth
+		fetch = rpc_fetcher(connect_to_eth(), args.batch_size)
+		start_block, end_block = args.start, args.end
+
+	started = time.perf_counter()
+	rows = export(fetch, start_block, end_block, args.out, args.batch_size, args.workers, args.resume)
+	print(f"{args.out}: {rows} transaction(s) after {time.perf_counter() - started:.1f}s")
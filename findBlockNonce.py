@@ -1,7 +1,62 @@
 #!/bin/python
 import hashlib
+import math
+import mmap
+import multiprocessing
 import os
 import random
+from collections import deque
+from itertools import islice
+
+
+PARALLEL_MIN_K = 18 # Below this a solution is found faster than worker processes start
+BATCH_SIZE = 1 << 16 # Nonces handed to a worker at a time
+BATCHES_PER_WORKER = 2 # Batches queued per worker, so none idles while results are read
+MMAP_MIN_BYTES = 64 * 1024 * 1024 # get_random_lines samples files this large by random offsets
+
+
+def zero_mask(k):
+    """
+        The last k bits of the hash are its last (k + 7) // 8 bytes, so only those bytes are read
+        Returns (number of bytes, mask of the k low bits)
+    """
+    return (k + 7) // 8, (1 << k) - 1
+
+
+def search_nonces(base_data, k, start, stop):
+    """Returns the smallest nonce in [start, stop) whose hash has k trailing zero bits, or None"""
+    # base_data is hashed once, every candidate only adds its nonce to a copy of that midstate
+    prefix = hashlib.sha256(base_data)
+    nbytes, mask = zero_mask(k)
+    from_bytes = int.from_bytes
+    for nonce_int in range(start, stop):
+        h = prefix.copy()
+        h.update(str(nonce_int).encode('utf-8'))
+        if not from_bytes(h.digest()[32 - nbytes:], 'big') & mask:
+            return nonce_int
+    return None
+
+
+def mine_parallel(base_data, k, processes=None, batch_size=BATCH_SIZE):
+    """
+        Splits the nonce space into batches of batch_size consecutive nonces and searches them on a process pool
+        Results are read in batch order, so the nonce returned is always the smallest valid one, the same
+        nonce the single process loop finds, whatever the number of processes or the scheduling
+        Returns the nonce as an integer
+    """
+    processes = processes or os.cpu_count() or 1
+    with multiprocessing.Pool(processes) as pool:
+        # Only a bounded window of batches is queued, Pool.imap would queue the endless nonce space up front
+        window = deque()
+        next_start = 0
+        while True:
+            while len(window) < processes * BATCHES_PER_WORKER:
+                window.append(pool.apply_async(search_nonces, (base_data, k, next_start, next_start + batch_size)))
+                next_start += batch_size
+            nonce_int = window.popleft().get()
+            if nonce_int is not None:
+                # Leaving the with block terminates the workers still searching later batches
+                return nonce_int
 
 
 def mine_block(k, prev_hash, transactions):
@@ -18,41 +73,104 @@ def mine_block(k, prev_hash, transactions):
         print("mine_block expects positive integer")
         return b'\x00'
 
-    # TODO your code to find a nonce here
     base_data = prev_hash
     for line in transactions:
         base_data += line.encode('utf-8')
 
-    nonce_int = 0
+    if k >= PARALLEL_MIN_K and (os.cpu_count() or 1) > 1:
+        nonce_int = mine_parallel(base_data, k)
+    else:
+        nonce_int = None
+        start = 0
+        while nonce_int is None:
+            nonce_int = search_nonces(base_data, k, start, start + BATCH_SIZE)
+            start += BATCH_SIZE
+    nonce = str(nonce_int).encode('utf-8')
+
+    assert isinstance(nonce, bytes), 'nonce should be of type bytes'
+    return nonce
+
+
+def reservoir_sample(lines, quantity, rng=random):
+    """
+        Uniform sample of quantity items (without replacement) from the iterable lines, in one pass
+        Only the reservoir is kept in memory. Uses Algorithm L, which draws the number of lines to skip
+        between replacements, so random numbers are only drawn O(quantity * log(n / quantity)) times
+        rng - source of randomness, the random module or a seeded random.Random
+    """
+    if quantity <= 0:
+        return []
+    lines = iter(lines)
+    reservoir = list(islice(lines, quantity))
+    if len(reservoir) < quantity:
+        return reservoir
+    w = math.exp(math.log(open_unit(rng)) / quantity)
     while True:
-        nonce_bytes = str(nonce_int).encode('utf-8')
-        hash_result = hashlib.sha256(base_data + nonce_bytes).digest()
-        bin_hash = bin(int.from_bytes(hash_result, byteorder='big'))  # Convert hash to binary string
+        skip = math.floor(math.log(open_unit(rng)) / math.log(1 - w))
+        line = next(islice(lines, skip, skip + 1), None)
+        if line is None:
+            return reservoir
+        reservoir[rng.randrange(quantity)] = line
+        w *= math.exp(math.log(open_unit(rng)) / quantity)
 
-        if bin_hash.endswith('0' * k):  # Check if hash ends with k zeros
-            nonce = nonce_bytes
-            break
 
-        nonce_int += 1
+def open_unit(rng=random):
+    """Uniform random float in (0, 1), the logs above are undefined at 0 and 1"""
+    u = rng.random()
+    while u == 0.0:
+        u = rng.random()
+    return u
 
-    assert isinstance(nonce, bytes), 'nonce should be of type bytes'
-    return nonce
+
+def mmap_random_lines(filename, quantity, rng=random):
+    """
+        quantity lines drawn uniformly (with replacement) from filename by jumping to random byte offsets
+        Only the lines picked are read, so the cost does not grow with the file size
+        A random offset lands in a line with probability proportional to its length, so a line is kept
+        with probability 1 / its length (newline included), which makes every line equally likely
+    """
+    if os.path.getsize(filename) == 0:
+        return []
+    with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        size = len(m)
+        random_lines = []
+        while len(random_lines) < quantity:
+            offset = rng.randrange(size)
+            line_start = m.rfind(b'\n', 0, offset) + 1
+            line_end = m.find(b'\n', offset)
+            line_end = size if line_end == -1 else line_end
+            # The last line may have no newline, only the bytes it really owns count
+            if rng.random() * (line_end - line_start + (line_end < size)) < 1:
+                random_lines.append(m[line_start:line_end].decode('utf-8').strip())
+        return random_lines
 
 
-def get_random_lines(filename, quantity):
+def get_random_lines(filename, quantity, mode=None, rng=random):
     """
     This is a helper function to get the quantity of lines ("transactions")
-    as a list from the filename given. 
-    Do not modify this function
+    as a list from the filename given.
+        mode - 'reservoir' streams the file once, holding only quantity lines in memory
+               'mmap' jumps to random offsets of a memory map and only reads the lines it picks
+               None picks 'mmap' for files of MMAP_MIN_BYTES or more, 'reservoir' otherwise
+        rng - source of randomness, a seeded random.Random makes the lines picked reproducible
+    Lines are sampled from the whole file, but the two modes sample differently: 'reservoir' draws
+    without replacement (no line twice, unless the file has fewer than quantity lines, then the rest
+    is drawn again from the lines there are), 'mmap' draws with replacement and may repeat a line
     """
-    lines = []
-    with open(filename, 'r') as f:
-        for line in f:
-            lines.append(line.strip())
+    if quantity <= 0:
+        return []
+    if mode is None:
+        mode = 'mmap' if os.path.getsize(filename) >= MMAP_MIN_BYTES else 'reservoir'
+    if mode == 'mmap':
+        return mmap_random_lines(filename, quantity, rng)
+    if mode != 'reservoir':
+        raise ValueError(f"Unknown sampling mode: {mode}")
 
-    random_lines = []
-    for x in range(quantity):
-        random_lines.append(lines[random.randint(0, quantity - 1)])
+    with open(filename, 'r') as f:
+        random_lines = [line.strip() for line in reservoir_sample(f, quantity, rng)]
+    rng.shuffle(random_lines)
+    if random_lines:
+        random_lines += [rng.choice(random_lines) for _ in range(quantity - len(random_lines))]
     return random_lines
 
 
@@ -67,5 +185,5 @@ if __name__ == '__main__':
     diff = 20
 
     transactions = get_random_lines(filename, num_lines)
-    nonce = mine_block(diff, transactions)
+    nonce = mine_block(diff, os.urandom(32), transactions)
     print(nonce)
@@ -1,6 +1,8 @@
 import requests
 import json
 
+from ipfs_cache import IpfsCache, CIDError
+
 # Pinata API Base URL
 PINATA_API_URL = "https://api.pinata.cloud"
 
@@ -33,17 +35,25 @@ def pin_to_ipfs(data):
 			
 
 def get_from_ipfs(cid,content_type="json"):
-	"""Retrieve JSON data from IPFS using a public gateway."""
+	"""Retrieve JSON data from IPFS, through the local CID cache and several public gateways."""
 	assert isinstance(cid, str), "get_from_ipfs expects a CID as a string"
 
-	response = requests.get(f"https://gateway.pinata.cloud/ipfs/{cid}")
+	try:
+		content = get_ipfs_cache().get(cid)
+	except (IOError, CIDError) as e:
+		raise Exception(f"Error: Failed to retrieve data from IPFS: {e}")
+
+	data = json.loads(content)
+	assert isinstance(data, dict), "get_from_ipfs should return a dict"
+	return data
 
-	if response.status_code == 200:
-		data = response.json()
-		assert isinstance(data, dict), "get_from_ipfs should return a dict"
-		return data
-	else:
-		raise Exception(f"Error: Failed to retrieve data from IPFS: {response.text}")
 
+_ipfs_cache = None
 
 
+def get_ipfs_cache():
+	"""The IpfsCache shared by every get_from_ipfs call (its metrics are in get_ipfs_cache().metrics.snapshot())"""
+	global _ipfs_cache
+	if _ipfs_cache is None:
+		_ipfs_cache = IpfsCache()
+	return _ipfs_cache
@@ -0,0 +1,305 @@
+"""
+	Read-through cache for IPFS content, keyed by CID
+
+	A CID names immutable content, so once fetched (and checked against the CID) it is served from a
+	memory LRU or from disk forever after. Misses go to several gateways with hedged requests: the first
+	gateway gets the request, the next one joins if no good answer came within HEDGE_DELAY (or right away
+	if the previous one failed), and the first response that matches the CID wins
+
+	Verification recomputes the CID from the bytes a gateway returns. That is possible for CIDv1 raw
+	leaves and for single-chunk files (up to CHUNK_SIZE bytes) stored as dag-pb/UnixFS, which covers
+	CIDv0 JSON pinned with pin_to_ipfs. Anything else cannot be checked from the file bytes alone, and
+	neither can what this module cannot parse (other multibases such as base58btc CIDv1, CIDs with a
+	path): the first answer is returned but never cached, and counted as unverified
+"""
+import base64
+import hashlib
+import os
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+GATEWAYS = ["https://gateway.pinata.cloud/ipfs/", "https://ipfs.io/ipfs/", "https://dweb.link/ipfs/"]
+CACHE_DIR = "ipfs_cache"
+MEMORY_BYTES = 64 * 1024 * 1024 # Content kept in the memory LRU
+HEDGE_DELAY = 0.5 # Seconds to wait for a gateway before also asking the next one
+TIMEOUT = 10 # Seconds per gateway request
+CHUNK_SIZE = 262144 # Default chunk size of ipfs add, larger files span several blocks
+
+BASE58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+SHA2_256 = 0x12
+DAG_PB = 0x70
+RAW = 0x55
+
+
+class CIDError(ValueError):
+	pass
+
+
+def base58_decode(s):
+	n = 0
+	for c in s:
+		i = BASE58_ALPHABET.find(c)
+		if i < 0:
+			raise CIDError(f"Invalid base58 character {c!r}")
+		n = n * 58 + i
+	raw = n.to_bytes((n.bit_length() + 7) // 8, 'big')
+	return b'\x00' * (len(s) - len(s.lstrip('1'))) + raw
+
+
+def read_varint(data, pos):
+	value = shift = 0
+	while True:
+		if pos >= len(data):
+			raise CIDError("Truncated varint")
+		b = data[pos]
+		value |= (b & 0x7f) << shift
+		pos += 1
+		if not b & 0x80:
+			return value, pos
+		shift += 7
+
+
+def varint(n):
+	out = bytearray()
+	while True:
+		b = n & 0x7f
+		n >>= 7
+		if n:
+			out.append(b | 0x80)
+		else:
+			out.append(b)
+			return bytes(out)
+
+
+def parse_cid(cid):
+	"""Returns (version, codec, multihash code, digest)"""
+	if cid.startswith('Qm') and len(cid) == 46:
+		multihash = base58_decode(cid)
+		version, codec = 0, DAG_PB
+	elif cid.startswith('b'):
+		# Multibase 'b': lowercase base32 without padding, the default for CIDv1
+		body = cid[1:].upper()
+		try:
+			data = base64.b32decode(body + '=' * (-len(body) % 8))
+		except ValueError as e:
+			raise CIDError(f"Invalid base32 CID {cid}: {e}")
+		version, pos = read_varint(data, 0)
+		codec, pos = read_varint(data, pos)
+		multihash = data[pos:]
+		if version != 1:
+			raise CIDError(f"Unsupported CID version {version}")
+	else:
+		raise CIDError(f"Unsupported CID encoding: {cid}")
+	code, pos = read_varint(multihash, 0)
+	length, pos = read_varint(multihash, pos)
+	digest = multihash[pos:]
+	if len(digest) != length:
+		raise CIDError(f"Digest length mismatch in {cid}")
+	return version, codec, code, digest
+
+
+def unixfs_file_node(content):
+	"""dag-pb node of a single-chunk UnixFS file, as ipfs add builds it"""
+	unixfs = b'\x08\x02' # Type = File
+	if content:
+		unixfs += b'\x12' + varint(len(content)) + content # Data
+	unixfs += b'\x18' + varint(len(content)) # filesize
+	return b'\x0a' + varint(len(unixfs)) + unixfs # PBNode.Data, no links
+
+
+def verify_content(cid, content):
+	"""
+		True if content is what cid names, False if it is not,
+		None if it cannot be told from the file bytes (another hash function or a multi-block file)
+	"""
+	_, codec, code, digest = parse_cid(cid)
+	if code != SHA2_256:
+		return None
+	if codec == RAW:
+		return hashlib.sha256(content).digest() == digest
+	if codec == DAG_PB:
+		if hashlib.sha256(unixfs_file_node(content)).digest() == digest:
+			return True
+		# A bigger file is a tree of blocks, the root cannot be rebuilt from the bytes alone
+		return False if len(content) <= CHUNK_SIZE else None
+	return None
+
+
+class Metrics:
+	"""Hit/miss counters and gateway latencies, thread-safe"""
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.counts = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'verify_failures': 0, 'unverified': 0, 'failures': 0}
+		self.gateway_requests = {}
+		self.gateway_wins = {}
+		self.gateway_errors = {}
+		self.latencies = []
+
+	def count(self, name, gateway=None):
+		with self.lock:
+			if gateway is None:
+				self.counts[name] += 1
+			else:
+				table = getattr(self, name)
+				table[gateway] = table.get(gateway, 0) + 1
+
+	def latency(self, seconds):
+		with self.lock:
+			self.latencies.append(seconds)
+
+	def snapshot(self):
+		with self.lock:
+			latencies = sorted(self.latencies)
+			lookups = self.counts['memory_hits'] + self.counts['disk_hits'] + self.counts['misses']
+			stats = dict(self.counts)
+			stats['hit_rate'] = (lookups - self.counts['misses']) / lookups if lookups else None
+			stats['fetch_seconds'] = {
+				'p50': latencies[len(latencies) // 2] if latencies else None,
+				'p95': latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else None,
+				'max': latencies[-1] if latencies else None,
+			}
+			stats['gateway_requests'] = dict(self.gateway_requests)
+			stats['gateway_wins'] = dict(self.gateway_wins)
+			stats['gateway_errors'] = dict(self.gateway_errors)
+			return stats
+
+
+def http_get(url, timeout):
+	with urllib.request.urlopen(url, timeout=timeout) as response:
+		return response.read()
+
+
+class IpfsCache:
+	def __init__(self, gateways=None, cache_dir=CACHE_DIR, memory_bytes=MEMORY_BYTES, hedge_delay=HEDGE_DELAY,
+				 timeout=TIMEOUT, fetch=http_get):
+		"""
+			gateways - URL prefixes ending in /ipfs/, tried in order (IPFS_GATEWAYS, comma separated, overrides the default)
+			cache_dir - on-disk store, None to only cache in memory
+			fetch - function(url, timeout) returning the response bytes or raising
+		"""
+		if gateways is None:
+			gateways = os.environ['IPFS_GATEWAYS'].split(',') if os.environ.get('IPFS_GATEWAYS') else GATEWAYS
+		self.gateways = list(gateways)
+		self.cache_dir = cache_dir
+		self.memory_bytes = memory_bytes
+		self.hedge_delay = hedge_delay
+		self.timeout = timeout
+		self.fetch = fetch
+		self.memory = OrderedDict()
+		self.memory_used = 0
+		self.lock = threading.Lock()
+		self.metrics = Metrics()
+
+	def path(self, cid):
+		return os.path.join(self.cache_dir, cid[-2:], cid)
+
+	def remember(self, cid, content):
+		if len(content) > self.memory_bytes:
+			return
+		with self.lock:
+			if cid in self.memory:
+				self.memory_used -= len(self.memory.pop(cid))
+			self.memory[cid] = content
+			self.memory_used += len(content)
+			while self.memory_used > self.memory_bytes:
+				_, dropped = self.memory.popitem(last=False)
+				self.memory_used -= len(dropped)
+
+	def cached(self, cid):
+		with self.lock:
+			content = self.memory.get(cid)
+			if content is not None:
+				self.memory.move_to_end(cid)
+		if content is not None:
+			self.metrics.count('memory_hits')
+			return content
+		if self.cache_dir is not None and os.path.exists(self.path(cid)):
+			with open(self.path(cid), 'rb') as f:
+				content = f.read()
+			self.metrics.count('disk_hits')
+			self.remember(cid, content)
+			return content
+		return None
+
+	def store(self, cid, content):
+		self.remember(cid, content)
+		if self.cache_dir is None:
+			return
+		path = self.path(cid)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		tmp_path = f"{path}.{threading.get_ident()}.tmp"
+		with open(tmp_path, 'wb') as f:
+			f.write(content)
+		os.replace(tmp_path, path)
+
+	def get(self, cid):
+		"""Content of cid, from the cache or the gateways. Raises IOError if no gateway returned it"""
+		try:
+			parse_cid(cid)
+		except CIDError:
+			# Nothing to check the answer against, and the string is not safe as a file name,
+			# so it skips the cache both ways and is fetched the way get_from_ipfs always did
+			self.metrics.count('misses')
+			return self.fetch_hedged(cid, verifiable=False)
+		content = self.cached(cid)
+		if content is not None:
+			return content
+		self.metrics.count('misses')
+		return self.fetch_hedged(cid)
+
+	def request(self, gateway, cid):
+		"""Returns (gateway, content or None, error)"""
+		self.metrics.count('gateway_requests', gateway)
+		try:
+			content = self.fetch(gateway + cid, self.timeout)
+		except Exception as e:
+			self.metrics.count('gateway_errors', gateway)
+			return gateway, None, f"{gateway}: {e}"
+		return gateway, content, None
+
+	def fetch_hedged(self, cid, verifiable=True):
+		"""
+			verifiable - False for a path parse_cid rejects, its content is never checked or cached
+			Every fetch gets its own threads, one per gateway. A running request cannot be cancelled, so a slow
+			loser keeps its thread until the request timeout, but no later fetch ever queues behind it
+		"""
+		start = time.perf_counter()
+		waiting = list(self.gateways)
+		running = set()
+		errors = []
+		pool = ThreadPoolExecutor(max_workers=max(1, len(self.gateways)))
+		try:
+			while waiting or running:
+				if waiting:
+					running.add(pool.submit(self.request, waiting.pop(0), cid))
+				# Wait for an answer, but only HEDGE_DELAY while there is another gateway to ask
+				done, running = wait(running, timeout=self.hedge_delay if waiting else None, return_when=FIRST_COMPLETED)
+				for future in done:
+					gateway, content, error = future.result()
+					if error is not None:
+						errors.append(error)
+						continue
+					ok = verify_content(cid, content) if verifiable else None
+					if ok is False:
+						self.metrics.count('verify_failures')
+						self.metrics.count('gateway_errors', gateway)
+						errors.append(f"{gateway}: content does not match {cid}")
+						continue
+					self.metrics.count('gateway_wins', gateway)
+					# What the caller waited, failed and hedged requests included
+					self.metrics.latency(time.perf_counter() - start)
+					if ok is None:
+						# Nothing to check it against, so it is passed on but not cached
+						self.metrics.count('unverified')
+					else:
+						self.store(cid, content)
+					return content
+		finally:
+			# Returns at once, requests still running finish (or time out) on their own
+			pool.shutdown(wait=False, cancel_futures=True)
+		self.metrics.count('failures')
+		raise IOError(f"No gateway returned {cid}: {'; '.join(errors)}")
@@ -4,18 +4,37 @@ from web3.middleware import ExtraDataToPOAMiddleware #Necessary for POA chains
 from pathlib import Path
 import json
 from datetime import datetime
-import pandas as pd
-
-
-def scan_blocks(chain, start_block, end_block, contract_address, eventfile='deposit_logs.csv'):
+from block_cache import BlockTimestampCache
+from deposit_writer import DepositWriter
+from reorg import confirmed_head
+
+
+# Adaptive eth_getLogs chunking
+INITIAL_CHUNK = 500 # Blocks per eth_getLogs call to start with
+MIN_CHUNK = 1
+MAX_CHUNK = 10000
+# Substrings of node errors that mean "ask for a smaller range", as the providers word them. Kept specific so
+# that rate limits ("limit exceeded", "too many requests") and other errors are raised instead of shrinking
+TOO_LARGE_ERRORS = (
+    'query returned more than', # geth, Infura
+    'block range is too large', 'block range too large', 'block range is too wide',
+    'exceed maximum block range', # BSC
+    'block range limit exceeded',
+    'requested too many blocks', # AvalancheGo
+    'exceeds max results',
+    'log response size exceeded', # Alchemy
+    'is limited to a', # QuickNode: "eth_getLogs is limited to a 10,000 range"
+    'query timeout exceeded',
+    'timed out',
+)
+
+DEPOSIT_ABI = json.loads('[ { "anonymous": false, "inputs": [ { "indexed": true, "internalType": "address", "name": "token", "type": "address" }, { "indexed": true, "internalType": "address", "name": "recipient", "type": "address" }, { "indexed": false, "internalType": "uint256", "name": "amount", "type": "uint256" } ], "name": "Deposit", "type": "event" }]')
+
+
+def connect_to(chain):
     """
-    chain - string (Either 'bsc' or 'avax')
-    start_block - integer first block to scan
-    end_block - integer last block to scan
-    contract_address - the address of the deployed contract
-
-	This function reads "Deposit" events from the specified contract, 
-	and writes information about the events to the file "deposit_logs.csv"
+        chain - string (Either 'bsc' or 'avax')
+        Returns a Web3 instance connected to the testnet of chain
     """
     if chain == 'avax':
         api_url = f"https://api.avax-test.network/ext/bc/C/rpc" #AVAX C-chain testnet
@@ -29,67 +48,119 @@ def scan_blocks(chain, start_block, end_block, contract_address, eventfile='depo
         w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
     else:
         w3 = Web3(Web3.HTTPProvider(api_url))
+    return w3
 
-    DEPOSIT_ABI = json.loads('[ { "anonymous": false, "inputs": [ { "indexed": true, "internalType": "address", "name": "token", "type": "address" }, { "indexed": true, "internalType": "address", "name": "recipient", "type": "address" }, { "indexed": false, "internalType": "uint256", "name": "amount", "type": "uint256" } ], "name": "Deposit", "type": "event" }]')
-    contract = w3.eth.contract(address=contract_address, abi=DEPOSIT_ABI)
 
-    arg_filter = {}
+def is_too_large(error):
+    """Returns True if error looks like the node refused (or timed out on) an eth_getLogs range"""
+    message = str(error).lower()
+    return any(e in message for e in TOO_LARGE_ERRORS)
+
+
+def get_event_chunks(event, start_block, end_block, chunk_size=INITIAL_CHUNK, stats=None):
+    """
+        event - a contract event, e.g. contract.events.Deposit()
+        Yields (from_block, to_block, events) covering start_block..end_block with one eth_getLogs
+        call per chunk. The chunk is halved when the node says the range is too large (or times out)
+        and doubled after a chunk comes back empty
+        stats - optional dict, 'calls' and 'retries' are counted in it
+    """
+    block = start_block
+    while block <= end_block:
+        to_block = min(end_block, block + chunk_size - 1)
+        try:
+            if stats is not None:
+                stats['calls'] = stats.get('calls', 0) + 1
+            events = event.get_logs(from_block=block, to_block=to_block)
+        except Exception as e:
+            if chunk_size <= MIN_CHUNK or not is_too_large(e):
+                raise
+            chunk_size = max(MIN_CHUNK, chunk_size // 2)
+            if stats is not None:
+                stats['retries'] = stats.get('retries', 0) + 1
+            continue
+
+        yield block, to_block, events
+        if not events:
+            chunk_size = min(MAX_CHUNK, chunk_size * 2)
+        block = to_block + 1
+
+
+def deposit_row(chain, evt, block_timestamp):
+    """Formats a Deposit event as a row of deposit_logs.csv"""
+    timestamp = datetime.utcfromtimestamp(block_timestamp).strftime('%m/%d/%Y %H:%M:%S')
+    return {
+        'chain': chain,
+        'token': evt.args['token'],
+        'recipient': evt.args['recipient'],
+        'amount': evt.args['amount'],
+        'transactionHash': evt.transactionHash.hex(),
+        'address': evt.address,
+        'date': timestamp
+    }
+
+
+def scan_blocks(chain, start_block, end_block, contract_address, eventfile='deposit_logs.csv', w3=None, timestamp_cache=None,
+                resume=False, columnar=None):
+    """
+    chain - string (Either 'bsc' or 'avax')
+    start_block - integer first block to scan
+    end_block - integer last block to scan
+    contract_address - the address of the deployed contract
+    w3 - optional Web3 instance to use instead of connecting to chain
+    timestamp_cache - optional BlockTimestampCache, defaults to the one saved in block_timestamps.json
+    resume - continue an interrupted scan of the same range from its last checkpoint
+             (rows from blocks that were reorged out since then are dropped and scanned again)
+    columnar - optional 'parquet' to also write the rows as Parquet files (needs pyarrow)
+
+	This function reads "Deposit" events from the specified contract, 
+	and writes information about the events to the file "deposit_logs.csv"
+    """
+    if w3 is None:
+        w3 = connect_to(chain)
+    contract = w3.eth.contract(address=contract_address, abi=DEPOSIT_ABI)
 
+    # "latest" means the newest confirmed block, so a reorg cannot remove rows we already wrote
     if start_block == "latest":
-        start_block = w3.eth.get_block_number()
+        start_block = confirmed_head(w3, chain)
     if end_block == "latest":
-        end_block = w3.eth.get_block_number()
+        end_block = confirmed_head(w3, chain)
 
     if end_block < start_block:
         print( f"Error end_block < start_block!" )
         print( f"end_block = {end_block}" )
         print( f"start_block = {start_block}" )
 
-    if start_block == end_block:
-        print( f"Scanning block {start_block} on {chain}" )
-    else:
-        print( f"Scanning blocks {start_block} - {end_block} on {chain}" )
-
-    rows = []
-
-    def process_event(evt):
-        block = w3.eth.get_block(evt.blockNumber)
-        timestamp = datetime.utcfromtimestamp(block.timestamp).strftime('%m/%d/%Y %H:%M:%S')
-        rows.append({
-            'chain': chain,
-            'token': evt.args['token'],
-            'recipient': evt.args['recipient'],
-            'amount': evt.args['amount'],
-            'transactionHash': evt.transactionHash.hex(),
-            'address': evt.address,
-            'date': timestamp
-        })
-
-    # Handle small ranges all at once
-    if end_block - start_block < 30:
-        event_filter = contract.events.Deposit.create_filter(from_block=start_block,to_block=end_block,argument_filters=arg_filter)
-        events = event_filter.get_all_entries()
-        #print( f"Got {len(events)} entries for block {block_num}" )
-        # TODO YOUR CODE HERE
-        for evt in events:
-            process_event(evt)
-
-    # Large range: scan block-by-block
+    # Rows are appended to eventfile as each chunk is scanned
+    writer = DepositWriter(eventfile, (chain, contract_address, start_block), resume=resume, columnar=columnar,
+                           block_hash=lambda n: w3.eth.get_block(n)['hash'])
+    scan_start = writer.resume_block() or start_block
+
+    if scan_start == end_block:
+        print( f"Scanning block {scan_start} on {chain}" )
     else:
-        for block_num in range(start_block,end_block+1):
-            event_filter = contract.events.Deposit.create_filter(from_block=block_num,to_block=block_num,argument_filters=arg_filter)
-            events = event_filter.get_all_entries()
-            #print( f"Got {len(events)} entries for block {block_num}" )
-            # TODO YOUR CODE HERE
-            for evt in events:
-                process_event(evt)
-
-    
-    # Write all collected data to CSV
-    if rows:
-        df = pd.DataFrame(rows)
-        df.to_csv(eventfile, index=False)
-        print(f"Saved {len(rows)} events to {eventfile}")
+        print( f"Scanning blocks {scan_start} - {end_block} on {chain}" )
+
+    if timestamp_cache is None:
+        timestamp_cache = BlockTimestampCache()
+
+    # One eth_getLogs per chunk, the chunk size adapts to how busy the range is
+    stats = {}
+    try:
+        for chunk_start, chunk_end, events in get_event_chunks(contract.events.Deposit(), scan_start, end_block, stats=stats):
+            # Headers for every block in the chunk come in one batch, repeated blocks come from the cache
+            timestamps = timestamp_cache.fetch(w3, chain, [evt.blockNumber for evt in events]) if events else {}
+            writer.write_rows([deposit_row(chain, evt, timestamps[evt.blockNumber]) for evt in events])
+            writer.chunk_done(chunk_start, chunk_end)
+    finally:
+        # Whatever was scanned up to the last chunk is kept and checkpointed
+        writer.close()
+        timestamp_cache.save()
+    print( f"Scanned {end_block - scan_start + 1} blocks with {stats.get('calls', 0)} eth_getLogs call(s)" )
+    print( f"Block timestamps: {timestamp_cache.hits} cached, {timestamp_cache.misses} fetched" )
+
+    if writer.rows:
+        print(f"Saved {writer.rows} events to {eventfile}")
     else:
         print("No Deposit events found in the given block range.")
 
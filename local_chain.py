@@ -0,0 +1,190 @@
+"""
+    A small in-process stand-in for a chain, implementing only the part of the Web3 API
+    that the scanners in this repo use (get_block_number, get_block and contract events).
+    Every simulated RPC is counted in chain.rpc_calls, so benchmarks can report RPC usage
+    without a node. Nothing here talks to the network
+"""
+import bisect
+import hashlib
+import time
+from collections import Counter
+
+GENESIS_TIME = 1700000000
+BLOCK_TIME = 2 # Seconds between simulated blocks
+
+
+class AttrDict(dict):
+    """dict that also allows attribute access, like web3's AttributeDict"""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class LocalEvent:
+    def __init__(self, chain, address, name):
+        self.chain = chain
+        self.address = address
+        self.name = name
+
+    def __call__(self):
+        return self
+
+    def get_logs(self, from_block, to_block, argument_filters=None):
+        self.chain.rpc('eth_getLogs')
+        if self.chain.max_range is not None and to_block - from_block + 1 > self.chain.max_range:
+            raise ValueError(f"block range is too wide (max {self.chain.max_range})")
+        logs = self.chain.logs_between(self.address, self.name, from_block, to_block)
+        if self.chain.max_results is not None and len(logs) > self.chain.max_results:
+            raise ValueError(f"query returned more than {self.chain.max_results} results")
+        return logs
+
+    def create_filter(self, from_block, to_block, argument_filters=None):
+        self.chain.rpc('eth_newFilter')
+        return LocalFilter(self, from_block, to_block)
+
+
+class LocalFilter:
+    def __init__(self, event, from_block, to_block):
+        self.event = event
+        self.from_block = from_block
+        self.to_block = to_block
+
+    def get_all_entries(self):
+        self.event.chain.rpc('eth_getFilterLogs')
+        return self.event.chain.logs_between(self.event.address, self.event.name, self.from_block, self.to_block)
+
+
+class LocalContract:
+    def __init__(self, chain, address):
+        self.address = address
+        self.events = AttrDict({name: LocalEvent(chain, address, name) for name in chain.event_names})
+
+
+class LocalEth:
+    def __init__(self, chain):
+        self.chain = chain
+
+    def get_block_number(self):
+        self.chain.rpc('eth_blockNumber')
+        return self.chain.head
+
+    @property
+    def block_number(self):
+        return self.get_block_number()
+
+    def get_block(self, block_identifier, full_transactions=False):
+        self.chain.rpc('eth_getBlockByNumber')
+        if block_identifier == 'latest':
+            block_identifier = self.chain.head
+        return self.chain.block(block_identifier)
+
+    def contract(self, address, abi=None):
+        return LocalContract(self.chain, address)
+
+
+class LocalBatch:
+    """Mimics w3.batch_requests(): everything added is answered by one counted 'batch' call"""
+
+    def __init__(self, chain):
+        self.chain = chain
+        self.results = []
+
+    def __enter__(self):
+        self.chain._batch = self
+        return self
+
+    def __exit__(self, *exc):
+        self.chain._batch = None
+        return False
+
+    def add(self, result):
+        self.results.append(result)
+
+    def execute(self):
+        self.chain._batch = None
+        self.chain.rpc('batch')
+        return self.results
+
+
+class LocalChain:
+    """
+        head - number of the latest block
+        max_results - if set, eth_getLogs fails when a query matches more logs than this
+        max_range - if set, eth_getLogs fails for ranges wider than this many blocks
+        latency - seconds each simulated RPC call sleeps, to model a round trip
+    """
+
+    def __init__(self, head=0, max_results=None, max_range=None, latency=0.0, event_names=('Deposit', 'Unwrap')):
+        self.head = head
+        self.max_results = max_results
+        self.max_range = max_range
+        self.latency = latency
+        self.event_names = event_names
+        self.rpc_calls = Counter()
+        self.eth = LocalEth(self)
+        self._logs = {} # block number -> list of logs
+        self._log_blocks = [] # sorted block numbers that have logs
+        self._batch = None
+        self._forks = [] # first block of every simulated reorg
+
+    def batch_requests(self):
+        return LocalBatch(self)
+
+    def rpc(self, method):
+        if self._batch is not None:
+            # Calls made inside batch_requests() travel in the batch's single round trip
+            return
+        self.rpc_calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def total_calls(self):
+        return sum(self.rpc_calls.values())
+
+    def block_hash(self, block_number):
+        # Every reorg at or below block_number gives the block a new identity
+        branch = sum(1 for fork in self._forks if block_number >= fork)
+        return hashlib.sha256(f"block-{block_number}-{branch}".encode('utf-8')).digest()
+
+    def reorg(self, from_block, drop_logs=True):
+        """Replaces every block from from_block on with a different branch (optionally without their logs)"""
+        self._forks.append(from_block)
+        if drop_logs:
+            for block_number in [n for n in self._log_blocks if n >= from_block]:
+                del self._logs[block_number]
+            self._log_blocks = [n for n in self._log_blocks if n < from_block]
+
+    def block(self, block_number):
+        return AttrDict(
+            number=block_number,
+            hash=self.block_hash(block_number),
+            parentHash=self.block_hash(block_number - 1),
+            timestamp=GENESIS_TIME + BLOCK_TIME * block_number,
+        )
+
+    def add_log(self, block_number, address, name='Deposit', **args):
+        """Adds an event log in block_number and moves the head forward if needed"""
+        logs = self._logs.setdefault(block_number, [])
+        if len(logs) == 0:
+            bisect.insort(self._log_blocks, block_number)
+        log_index = len(logs)
+        tx_hash = hashlib.sha256(f"tx-{block_number}-{log_index}".encode('utf-8')).digest()
+        logs.append(AttrDict(
+            event=name,
+            args=AttrDict(args),
+            address=address,
+            blockNumber=block_number,
+            logIndex=log_index,
+            transactionHash=tx_hash,
+        ))
+        self.head = max(self.head, block_number)
+        return logs[-1]
+
+    def logs_between(self, address, name, from_block, to_block):
+        first = bisect.bisect_left(self._log_blocks, from_block)
+        last = bisect.bisect_right(self._log_blocks, to_block)
+        return [log for block_number in self._log_blocks[first:last] for log in self._logs[block_number]
+                if log.address == address and log.event == name]
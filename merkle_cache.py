@@ -0,0 +1,148 @@
+"""
+    On-disk cache of built Merkle trees
+
+    A tree is stored once, all levels back to back, in <cache_dir>/<key>.merkle where key is the
+    keccak of the concatenated leaves. Later runs memory-map the file and get a MerkleTree whose
+    levels are views into the map, so a proof only reads the log2(n) pages it needs and nothing is
+    rebuilt. A mapped tree is spot-checked against the leaves before it is used (its leaf level must be
+    the leaves, and the proofs of CHECK_SAMPLES spread-out leaves must lead to its root), and trees that
+    have to be built can be checked against the contract's merkleRoot
+
+    File layout: header (MAGIC, FORMAT_VERSION, hash size, number of levels), the key, one uint64
+    node count per level, then the levels themselves, leaves first
+"""
+import mmap
+import os
+import struct
+
+from eth_hash.auto import keccak
+
+from merkle_engine import HASH_SIZE, MerkleTree, verify_proof
+
+MERKLE_CACHE_DIR = "merkle_cache"
+MAGIC = b"MRKL"
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHHI')
+COUNT = struct.Struct('<Q')
+CHECK_SAMPLES = 16 # Leaves whose proofs are checked against the root of a mapped tree, O(log n) hashes each
+
+
+def leaves_key(leaves):
+    """Hex keccak of the leaves (a list of bytes32, or one bytes-like object with all of them)"""
+    data = leaves if isinstance(leaves, (bytes, bytearray, memoryview)) else b"".join(leaves)
+    return keccak(bytes(data)).hex()
+
+
+def onchain_merkle_root(contract):
+    """The contract's merkleRoot, read the way reading_the_chain.get_contract_values reads it"""
+    return bytes(contract.functions.merkleRoot().call())
+
+
+class MerkleCache:
+    def __init__(self, cache_dir=MERKLE_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.merkle")
+
+    def store(self, key, tree):
+        """Writes tree under key (to a temporary file first, so a crash never leaves half a file)"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, HASH_SIZE, len(tree.levels)))
+            f.write(bytes.fromhex(key))
+            for level in tree.levels:
+                f.write(COUNT.pack(len(level) // HASH_SIZE))
+            for level in tree.levels:
+                f.write(level)
+        os.replace(tmp_path, path)
+        return path
+
+    def load(self, key):
+        """Maps the tree stored under key, or returns None if there is none or the file does not check out"""
+        path = self.path(key)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return None
+        with open(path, 'rb') as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(m)
+        valid = False
+        try:
+            try:
+                magic, version, hash_size, num_levels = HEADER.unpack_from(view)
+                offset = HEADER.size
+                stored_key = bytes(view[offset:offset + 32]).hex()
+                offset += 32
+                counts = [COUNT.unpack_from(view, offset + i * COUNT.size)[0] for i in range(num_levels)]
+                offset += num_levels * COUNT.size
+            except struct.error:
+                print(f"Ignoring truncated Merkle cache file {path}")
+                return None
+            if (magic, version, hash_size, stored_key) != (MAGIC, FORMAT_VERSION, HASH_SIZE, key):
+                print(f"Ignoring Merkle cache file {path}, it was written for another format or leaf set")
+                return None
+            # Every level must halve (rounding up) down to a single root, and the file must hold exactly those nodes
+            shape_ok = num_levels > 0 and counts[-1] == 1 and all(b == (a + 1) // 2 for a, b in zip(counts, counts[1:]))
+            if not shape_ok or len(view) != offset + sum(counts) * HASH_SIZE:
+                print(f"Ignoring corrupt Merkle cache file {path}")
+                return None
+
+            levels = []
+            for count in counts:
+                levels.append(view[offset:offset + count * HASH_SIZE])
+                offset += count * HASH_SIZE
+            valid = True
+            return MerkleTree(levels)
+        finally:
+            # A tree that is returned keeps the map open through its level views
+            if not valid:
+                view.release()
+                m.close()
+
+    def check(self, tree, leaves):
+        """
+            Cheap consistency check of a mapped tree: its leaf level must be leaves, and the proofs of
+            CHECK_SAMPLES leaves spread over the tree (the last one included) must verify against its root
+        """
+        data = leaves if isinstance(leaves, (bytes, bytearray, memoryview)) else b"".join(leaves)
+        if tree.levels[0] != data:
+            return False
+        n = tree.num_leaves
+        samples = set(range(0, n, max(1, n // CHECK_SAMPLES))) | {n - 1}
+        return all(verify_proof(tree.root, tree[0][i], tree.proof(i)) for i in samples)
+
+    def get_or_build(self, leaves, expected_root=None, rebuild=False):
+        """
+            Returns the tree of leaves, from the cache if it is there and passes check(), otherwise built and stored
+            expected_root - the on-chain merkleRoot, a cached tree with another root is rebuilt, and a warning
+                            is printed if even the rebuilt tree does not match (the leaves are not the contract's)
+                            May also be a function returning it (or None), which is only called when the tree
+                            has to be built, so a cache hit needs no RPC
+            rebuild - ignore the cached tree and rewrite it, e.g. after the contract rejected a proof from it
+        """
+        key = leaves_key(leaves)
+        lazy_root = callable(expected_root)
+        if not lazy_root and expected_root is not None:
+            expected_root = bytes(expected_root)
+        tree = None if rebuild else self.load(key)
+        if tree is not None and not self.check(tree, leaves):
+            print(f"Cached tree {key} does not match its leaves, rebuilding")
+        elif tree is not None:
+            if lazy_root or expected_root is None or tree.root == expected_root:
+                self.hits += 1
+                return tree
+            print(f"Cached tree {key} has root {tree.root.hex()}, the contract has {expected_root.hex()}, rebuilding")
+        self.misses += 1
+        tree = MerkleTree.from_leaves(leaves)
+        self.store(key, tree)
+        if lazy_root:
+            expected_root = expected_root()
+            expected_root = bytes(expected_root) if expected_root is not None else None
+        if expected_root is not None and tree.root != expected_root:
+            print(f"Warning: Merkle root {tree.root.hex()} does not match the on-chain root {expected_root.hex()}, "
+                  f"proofs from this tree will not verify")
+        return tree
@@ -0,0 +1,283 @@
+"""
+    Compact Merkle tree for submitProof
+
+    Every level is one contiguous bytearray of 32-byte nodes instead of a list of bytes objects,
+    and pairs are hashed with the raw keccak primitive instead of Web3.solidity_keccak (which ABI
+    encodes its arguments on every call). The tree follows the same rules as submitProof.hash_pair
+    and build_merkle: pairs are sorted before hashing (OpenZeppelin's MerkleProof) and the last node
+    of an odd level is hashed with itself
+
+    A MerkleTree also behaves like the list of levels build_merkle used to return, so tree[0] is the
+    list of leaves, tree[-1][0] the root and prove_merkle works on it unchanged
+"""
+import multiprocessing
+import os
+from collections.abc import Sequence
+
+from eth_hash.auto import keccak
+
+HASH_SIZE = 32
+PARALLEL_MIN_PROOFS = 2000 # Below this, verify_many checks proofs in-process, starting workers costs more
+
+
+def hash_pair(a, b):
+    """keccak256 of the two 32-byte nodes in sorted order, what hash_pair computes with solidity_keccak"""
+    return keccak(a + b) if a < b else keccak(b + a)
+
+
+def build_level(level):
+    """Hashes the nodes of level (a bytes-like of 32-byte nodes) pairwise, returns the parent level as a bytearray"""
+    data = bytes(level)
+    n = len(data) // HASH_SIZE
+    parents = []
+    append = parents.append
+    for i in range(0, (n - 1) * HASH_SIZE, 2 * HASH_SIZE):
+        a = data[i:i + HASH_SIZE]
+        b = data[i + HASH_SIZE:i + 2 * HASH_SIZE]
+        append(keccak(a + b) if a < b else keccak(b + a))
+    if n % 2:
+        last = data[-HASH_SIZE:]
+        append(keccak(last + last))
+    return bytearray(b"".join(parents))
+
+
+class Level(Sequence):
+    """Read-only view of one tree level as a sequence of 32-byte bytes"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data) // HASH_SIZE
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("node index out of range")
+        return bytes(self.data[i * HASH_SIZE:(i + 1) * HASH_SIZE])
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+
+class MerkleTree(Sequence):
+    """
+        levels[0] holds the leaves, levels[-1] the root, each as HASH_SIZE-byte nodes back to back
+        Build one with MerkleTree.from_leaves(leaves), or MerkleTree(levels) for levels built before
+    """
+
+    def __init__(self, levels):
+        self.levels = levels
+
+    @classmethod
+    def from_leaves(cls, leaves):
+        """leaves - list of bytes32 values, or one bytes-like object holding them back to back"""
+        if isinstance(leaves, (bytes, bytearray, memoryview)):
+            data = bytearray(leaves)
+        else:
+            if not all(isinstance(leaf, bytes) and len(leaf) == HASH_SIZE for leaf in leaves):
+                raise ValueError("Leaves must be bytes32")
+            data = bytearray(b"".join(leaves))
+        if not data or len(data) % HASH_SIZE:
+            raise ValueError(f"Leaf data must be a non-empty multiple of {HASH_SIZE} bytes")
+        levels = [data]
+        while len(levels[-1]) > HASH_SIZE:
+            levels.append(build_level(levels[-1]))
+        return cls(levels)
+
+    @property
+    def root(self):
+        return bytes(self.levels[-1][:HASH_SIZE])
+
+    @property
+    def num_leaves(self):
+        return len(self.levels[0]) // HASH_SIZE
+
+    def node(self, level, index):
+        return self[level][index]
+
+    def proof(self, index):
+        """
+            Sibling of the node on every level below the root, leaf level first
+            The last node of an odd level is hashed with itself, so it is its own sibling in the proof
+        """
+        if not 0 <= index < self.num_leaves:
+            raise IndexError("leaf index out of range")
+        proof = []
+        for data in self.levels[:-1]:
+            sibling = index ^ 1
+            if sibling >= len(data) // HASH_SIZE:
+                sibling = index
+            proof.append(bytes(data[sibling * HASH_SIZE:(sibling + 1) * HASH_SIZE]))
+            index //= 2
+        return proof
+
+    def update(self, index, leaf):
+        """Replaces leaf index and rehashes only its path to the root, O(log n)"""
+        if not 0 <= index < self.num_leaves:
+            raise IndexError("leaf index out of range")
+        self._set_leaf(index, leaf)
+
+    def append(self, leaf):
+        """Adds a leaf after the last one, rehashing its path (and adding a root level when the tree fills up)"""
+        self._set_leaf(self.num_leaves, leaf)
+
+    def _set_leaf(self, index, leaf):
+        if not isinstance(leaf, bytes) or len(leaf) != HASH_SIZE:
+            raise ValueError("Leaves must be bytes32")
+        self._make_writable()
+        levels = self.levels
+        node = leaf
+        level = 0
+        while True:
+            data = levels[level]
+            if index * HASH_SIZE == len(data):
+                data += node
+            else:
+                data[index * HASH_SIZE:(index + 1) * HASH_SIZE] = node
+            count = len(data) // HASH_SIZE
+            if count == 1 and level == len(levels) - 1:
+                return
+            if level == len(levels) - 1:
+                levels.append(bytearray())
+            # The last node of an odd level is paired with itself, as in build_merkle
+            sibling = index ^ 1
+            other = data[sibling * HASH_SIZE:(sibling + 1) * HASH_SIZE] if sibling < count else node
+            node = hash_pair(node, bytes(other))
+            index //= 2
+            level += 1
+
+    def _make_writable(self):
+        # Trees mapped from merkle_cache are read-only views, the first change copies them into memory
+        self.levels = [data if isinstance(data, bytearray) else bytearray(data) for data in self.levels]
+
+    def multiproof(self, indices):
+        """
+            One proof for several leaves at once, in the format of OpenZeppelin's MerkleProof.multiProofVerify
+            Returns (leaves, proof, proof_flags): leaves in ascending index order, the sibling nodes none of the
+            leaves produce, and for every hash the verifier computes whether its second input comes from the
+            leaves/earlier hashes (True) or from proof (False)
+            Siblings shared by the leaves are hashed once and never sent, so k leaves cost
+            k + len(proof) - 1 hashes instead of k * depth
+            The last node of an odd level is hashed with itself, so it is sent as its own sibling in proof
+        """
+        known = sorted(set(indices))
+        if not known:
+            raise ValueError("multiproof needs at least one leaf")
+        if known[0] < 0 or known[-1] >= self.num_leaves:
+            raise IndexError("leaf index out of range")
+        leaves = [self[0][i] for i in known]
+        proof = []
+        flags = []
+        # The verifier consumes its inputs as a queue, all of one level before the next and in index
+        # order, so building level by level in index order gives the order it expects
+        for data in self.levels[:-1]:
+            count = len(data) // HASH_SIZE
+            parents = []
+            i = 0
+            while i < len(known):
+                index = known[i]
+                sibling = index ^ 1
+                if i + 1 < len(known) and known[i + 1] == sibling:
+                    flags.append(True)
+                    i += 2
+                else:
+                    flags.append(False)
+                    sibling = sibling if sibling < count else index
+                    proof.append(bytes(data[sibling * HASH_SIZE:(sibling + 1) * HASH_SIZE]))
+                    i += 1
+                parents.append(index // 2)
+            known = parents
+        return leaves, proof, flags
+
+    def to_lists(self):
+        """The tree as build_merkle used to return it, a list of lists of bytes"""
+        return [list(level) for level in self]
+
+    def __len__(self):
+        return len(self.levels)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [Level(data) for data in self.levels[i]]
+        return Level(self.levels[i])
+
+
+def process_multiproof(leaves, proof, proof_flags):
+    """
+        The root a multiproof rebuilds, a port of OpenZeppelin's MerkleProof.processMultiProof
+        Raises ValueError if the lengths do not fit together
+    """
+    total_hashes = len(proof_flags)
+    if len(leaves) + len(proof) != total_hashes + 1:
+        raise ValueError("Invalid multiproof")
+    hashes = []
+    leaf_pos = hash_pos = proof_pos = 0
+
+    def next_node():
+        nonlocal leaf_pos, hash_pos
+        if leaf_pos < len(leaves):
+            leaf_pos += 1
+            return bytes(leaves[leaf_pos - 1])
+        hash_pos += 1
+        return hashes[hash_pos - 1]
+
+    for flag in proof_flags:
+        a = next_node()
+        if flag:
+            b = next_node()
+        else:
+            b = bytes(proof[proof_pos])
+            proof_pos += 1
+        hashes.append(hash_pair(a, b))
+
+    if total_hashes > 0:
+        if proof_pos != len(proof):
+            raise ValueError("Invalid multiproof")
+        return hashes[-1]
+    if leaves:
+        return bytes(leaves[0])
+    return bytes(proof[0])
+
+
+def process_proof(leaf, proof):
+    """The root a single proof rebuilds, a port of OpenZeppelin's MerkleProof.processProof"""
+    computed = bytes(leaf)
+    for node in proof:
+        computed = hash_pair(computed, bytes(node))
+    return computed
+
+
+def verify_proof(root, leaf, proof):
+    """True if proof shows leaf is in the tree with root, exactly as the contract's MerkleProof.verify decides"""
+    return process_proof(leaf, proof) == bytes(root)
+
+
+def verify_multiproof(root, leaves, proof, proof_flags):
+    try:
+        return process_multiproof(leaves, proof, proof_flags) == bytes(root)
+    except (ValueError, IndexError):
+        return False
+
+
+def verify_chunk(root, claims):
+    return [verify_proof(root, leaf, proof) for leaf, proof in claims]
+
+
+def verify_many(root, claims, processes=None, chunk_size=1000):
+    """
+        Checks a list of (leaf, proof) claims against root, returns a list of booleans in the same order
+        Large lists are split into chunks of chunk_size and checked on a process pool
+    """
+    claims = [(bytes(leaf), [bytes(node) for node in proof]) for leaf, proof in claims]
+    root = bytes(root)
+    processes = processes or os.cpu_count() or 1
+    if len(claims) < PARALLEL_MIN_PROOFS or processes == 1:
+        return verify_chunk(root, claims)
+    chunks = [claims[i:i + chunk_size] for i in range(0, len(claims), chunk_size)]
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.starmap(verify_chunk, [(root, chunk) for chunk in chunks])
+    return [ok for chunk in results for ok in chunk]
@@ -0,0 +1,72 @@
+import threading
+
+# Substrings of node errors that mean our local nonce is out of step with the chain
+NONCE_ERRORS = (
+    'nonce too low',
+    'nonce too high',
+    'invalid nonce',
+    'replacement transaction underpriced',
+)
+
+# Substrings of node errors that mean this exact signed transaction is already in the mempool
+ALREADY_KNOWN_ERRORS = (
+    'already known',
+    'known transaction',
+)
+
+
+def is_nonce_error(error):
+    """Returns True if error looks like the node rejected the transaction because of its nonce"""
+    message = str(error).lower()
+    return any(e in message for e in NONCE_ERRORS)
+
+
+def is_already_known(error):
+    """
+        Returns True if the node already has this signed transaction, i.e. it was sent and its nonce is used
+        The transaction must not be signed again with a new nonce, that would send the call twice
+    """
+    message = str(error).lower()
+    return any(e in message for e in ALREADY_KNOWN_ERRORS)
+
+
+class NonceManager:
+    """
+        Hands out sequential nonces locally for each (chain, account) pair
+        The first nonce is read from the node (pending count), after that nonces are
+        incremented in memory so several transactions can be sent back-to-back
+        without waiting for each one to be mined
+    """
+
+    def __init__(self):
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def has(self, chain, address):
+        with self._lock:
+            return (chain, address) in self._next
+
+    def seed(self, chain, address, count):
+        """Sets the next nonce for (chain, address) to count, e.g. from get_transaction_count(address, 'pending')"""
+        with self._lock:
+            self._next[(chain, address)] = count
+
+    def take(self, chain, address):
+        """Returns the next nonce for an already seeded (chain, address) and reserves it"""
+        with self._lock:
+            nonce = self._next[(chain, address)]
+            self._next[(chain, address)] = nonce + 1
+            return nonce
+
+    def next_nonce(self, w3, chain, address):
+        """Returns the next nonce for address on chain, reading it from the node the first time only"""
+        if not self.has(chain, address):
+            self.resync(w3, chain, address)
+        return self.take(chain, address)
+
+    def resync(self, w3, chain, address):
+        """Throws away the local counter and reloads it from the node's pending transaction count"""
+        count = w3.eth.get_transaction_count(address, 'pending')
+        self.seed(chain, address, count)
+        print(f"Nonce for {address} on {chain} synced to {count}")
+        return count
@@ -0,0 +1,70 @@
+"""
+    Segmented Sieve of Eratosthenes for the Merkle leaves of submitProof
+
+    The sieve needs an upper bound on the n-th prime, taken from the prime number theorem
+    (Rosser's bound p_n < n (ln n + ln ln n) for n >= 6), and then marks composites one segment
+    at a time, so memory stays at SEGMENT_SIZE flags whatever n is. NumPy is used for the
+    segments when it is installed, a bytearray otherwise, both give the same primes
+"""
+import math
+from itertools import compress
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SEGMENT_SIZE = 1 << 18 # Numbers sieved at a time
+
+
+def nth_prime_bound(n):
+    """An integer that is at least the n-th prime (n >= 1)"""
+    if n < 6:
+        return 13 # The 6th prime, bounds the first five
+    return int(n * (math.log(n) + math.log(math.log(n)))) + 1
+
+
+def small_primes(limit):
+    """All primes <= limit, with a plain sieve (limit is only the square root of the real bound)"""
+    flags = bytearray([1]) * (limit + 1)
+    flags[:2] = b'\x00\x00'
+    for p in range(2, math.isqrt(limit) + 1):
+        if flags[p]:
+            flags[p * p::p] = bytes(len(range(p * p, limit + 1, p)))
+    return list(compress(range(limit + 1), flags))
+
+
+def sieve_segment(low, high, base_primes):
+    """Primes in [low, high), crossing off multiples of base_primes (all primes <= sqrt(high))"""
+    size = high - low
+    if np is not None:
+        flags = np.ones(size, dtype=bool)
+        for p in base_primes:
+            if p * p >= high:
+                break
+            start = max(p * p, -(-low // p) * p)
+            flags[start - low::p] = False
+        return (np.flatnonzero(flags) + low).tolist()
+
+    flags = bytearray([1]) * size
+    for p in base_primes:
+        if p * p >= high:
+            break
+        start = max(p * p, -(-low // p) * p)
+        flags[start - low::p] = bytes(len(range(start - low, size, p)))
+    return list(compress(range(low, high), flags))
+
+
+def first_primes(n, segment_size=SEGMENT_SIZE):
+    """Returns the first n primes as a list of ints, in ascending order"""
+    if n <= 0:
+        return []
+    bound = nth_prime_bound(n)
+    base_primes = small_primes(math.isqrt(bound) + 1)
+    primes = []
+    # Start at 2: sieve_segment never crosses off a base prime itself (multiples start at p * p)
+    for low in range(2, bound + 1, segment_size):
+        primes.extend(sieve_segment(low, min(bound + 1, low + segment_size), base_primes))
+        if len(primes) >= n:
+            break
+    return primes[:n]
@@ -4,6 +4,9 @@ from web3 import Web3
 from web3.middleware import ExtraDataToPOAMiddleware
 from web3.providers.rpc import HTTPProvider
 
+from block_analytics import priority_fee
+from contract_reader import ContractReader
+
 
 # If you use one of the suggested infrastructure providers, the url will be of the form
 # now_url  = f"https://eth.nownodes.io/{now_token}"
@@ -57,21 +60,17 @@ def is_ordered_block(w3, block_num):
 	#return ordered
 
 	# TODO YOUR CODE HERE
-	transactions = block.transactions
-
 	# Check if baseFeePerGas exists in block (EIP-1559 support)
-	base_fee = getattr(block, 'baseFeePerGas', 0)
-	
-	priority_fees = []
-	for tx in transactions:
-		if hasattr(tx, 'maxPriorityFeePerGas') and hasattr(tx, 'maxFeePerGas'):
-			priority_fee = min(tx.maxPriorityFeePerGas, tx.maxFeePerGas - base_fee)
-		else:
-			priority_fee = tx.gasPrice - base_fee if hasattr(tx, 'gasPrice') else 0
-		priority_fees.append(priority_fee)
-	
-	return priority_fees == sorted(priority_fees, reverse=True)
-    
+	base_fee = block.get('baseFeePerGas') or 0
+
+	# One pass: the block is ordered unless some priority fee is higher than the one before it
+	previous = None
+	for tx in block.transactions:
+		fee = priority_fee(tx, base_fee)
+		if previous is not None and fee > previous:
+			return False
+		previous = fee
+	return True
 
 
 def get_contract_values(contract, admin_address, owner_address):
@@ -88,39 +87,12 @@ def get_contract_values(contract, admin_address, owner_address):
 	check on available contract functions and transactions on the block explorer at
 	https://testnet.bscscan.com/address/0xaA7CAaDA823300D18D3c43f65569a47e78220073
 	"""
-	default_admin_role = int.to_bytes(0, 32, byteorder="big")
-
-	# TODO complete the following lines by performing contract calls
-	
-	# Get and return the merkleRoot from the provided contract
-	# Fetch merkleRoot from the contract
-	try:
-		onchain_root = contract.functions.merkleRoot().call()
-	except Exception as e:
-		print(f"Error retrieving merkleRoot: {e}")
-		onchain_root = None
-	
-	# Check the contract to see if the address "admin_address" has the role "default_admin_role"
-	# Get the default admin role identifier
-	try:
-		default_admin_role = contract.functions.DEFAULT_ADMIN_ROLE().call()
-	except Exception as e:
-		print(f"Error retrieving DEFAULT_ADMIN_ROLE: {e}")
-		default_admin_role = None
-	
-	# Check if admin_address has the default_admin_role
-	try:
-		has_role = contract.functions.hasRole(default_admin_role, admin_address).call() if default_admin_role else False
-	except Exception as e:
-		print(f"Error checking admin role: {e}")
-		has_role = False
-	
-	# Get the prime owned by the owner_address
-	try:
-		prime = contract.functions.getPrimeByOwner(owner_address).call()
-	except Exception as e:
-		print(f"Error retrieving prime: {e}")
-		prime = None  # Handle the missing function gracefully
+	# All three reads go out in one JSON-RPC batch (DEFAULT_ADMIN_ROLE only the first time, it is cached
+	# per contract), contract_reader.ContractReader does the same for many admins and owners at once
+	reader = ContractReader(contract.w3, contract, mode='batch')
+	onchain_root, has_roles, primes = reader.read_values([admin_address], [owner_address])
+	has_role = has_roles[admin_address]
+	prime = primes[owner_address]
 	
 	return onchain_root, has_role, prime
 
@@ -147,7 +119,7 @@ if __name__ == "__main__":
 	n = 5
 	for _ in range(n):
 		block_num = random.randint(1, latest_block)
-		ordered = is_ordered_block(block_num)
+		ordered = is_ordered_block(eth_w3, block_num)
 		if ordered:
 			print(f"Block {block_num} is ordered")
 		else:
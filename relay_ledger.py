@@ -0,0 +1,199 @@
+import json
+import sqlite3
+import time
+
+LEDGER_DB = "warden.db"
+MAX_ATTEMPTS = 3 # Times a relay that fails before reaching the node is tried before it is given up
+RETRY_DELAY = 30 # Seconds before a failed relay is tried again, doubled after every further failure
+
+# Relay states, in the order an event moves through them
+PENDING = 'pending'       # seen and claimed, relay transaction not signed yet
+SIGNED = 'signed'         # relay transaction signed and stored, it may or may not have reached the node
+SUBMITTED = 'submitted'   # relay transaction sent, receipt not seen yet
+CONFIRMED = 'confirmed'   # relay transaction mined successfully
+RETRY = 'retry'           # relay could not be sent (e.g. an RPC error), it is tried again
+FAILED = 'failed'         # relay transaction reverted, or could not be sent in MAX_ATTEMPTS tries
+UNFINISHED = (PENDING, SIGNED, RETRY, SUBMITTED)
+
+
+def event_keys(events):
+    """
+        Ledger keys of events, the logs of one get_logs call: (source transaction hash, position of the log
+        among the logs of its transaction in events)
+        logIndex counts from the start of the block, so it changes when a reorg re-includes the transaction
+        in another block, while the transaction's own logs keep their order. A get_logs range is made of
+        whole blocks, so every log of a transaction comes back in the same call
+    """
+    keys = [None] * len(events)
+    positions = {}
+    for i in sorted(range(len(events)), key=lambda i: (events[i].blockNumber, events[i].logIndex)):
+        tx = events[i].transactionHash.hex()
+        keys[i] = (tx, positions.get(tx, 0))
+        positions[tx] = keys[i][1] + 1
+    return keys
+
+
+class RelayLedger:
+    """
+        Persistent record of every bridge event the warden has relayed, keyed by (source tx hash, position
+        of the log in its transaction), see event_keys (the log_index column holds that position)
+        All keys are also held in memory so checking whether an event was already handled is O(1),
+        and neither overlapping scan windows nor a reorg that moves the source transaction to another
+        block make wrap()/withdraw() be called twice for the same event
+    """
+
+    def __init__(self, path=LEDGER_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS relays ("
+            " source_tx TEXT NOT NULL,"
+            " log_index INTEGER NOT NULL,"
+            " chain TEXT NOT NULL,"
+            " block_number INTEGER NOT NULL,"
+            " target_chain TEXT NOT NULL,"
+            " function_name TEXT NOT NULL,"
+            " args TEXT NOT NULL,"
+            " relay_tx TEXT,"
+            " state TEXT NOT NULL,"
+            " error TEXT,"
+            " updated_at REAL NOT NULL,"
+            " raw_tx TEXT,"
+            " nonce INTEGER,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (source_tx, log_index))"
+        )
+        # Ledgers written before the signed transaction was stored lack its columns
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(relays)")}
+        for column, column_type in (('raw_tx', 'TEXT'), ('nonce', 'INTEGER'), ('attempts', 'INTEGER NOT NULL DEFAULT 0')):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE relays ADD COLUMN {column} {column_type}")
+        self.conn.commit()
+        self._seen = set(self.conn.execute("SELECT source_tx, log_index FROM relays").fetchall())
+
+    def seen(self, key):
+        return tuple(key) in self._seen
+
+    def claim(self, key, event, chain, target_chain, function_name, args):
+        """
+            Records event (with ledger key key) as PENDING before anything is sent
+            Returns False if the event is already in the ledger (someone else relays it)
+        """
+        key = tuple(key)
+        if key in self._seen:
+            return False
+        self.conn.execute(
+            "INSERT OR IGNORE INTO relays (source_tx, log_index, chain, block_number, target_chain, function_name,"
+            " args, state, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key[0], key[1], chain, event.blockNumber, target_chain, function_name, json.dumps(list(args)), PENDING, time.time())
+        )
+        self.conn.commit()
+        self._seen.add(key)
+        return True
+
+    def mark_signed(self, key, relay_tx, raw_tx, nonce):
+        """
+            Stores the signed relay transaction before it is broadcast, so a run that crashes right after
+            sending it can send the same bytes again instead of signing a second transaction
+        """
+        self.conn.execute(
+            "UPDATE relays SET state = ?, relay_tx = ?, raw_tx = ?, nonce = ?, error = NULL, updated_at = ?"
+            " WHERE source_tx = ? AND log_index = ?",
+            (SIGNED, bytes(relay_tx).hex(), bytes(raw_tx).hex(), nonce, time.time(), key[0], key[1])
+        )
+        self.conn.commit()
+
+    def mark_submitted(self, key, relay_tx):
+        self._set_state(key, SUBMITTED, relay_tx=relay_tx.hex() if isinstance(relay_tx, bytes) else relay_tx)
+
+    def mark_confirmed(self, key):
+        self._set_state(key, CONFIRMED)
+
+    def mark_failed(self, key, error=None):
+        """Gives the relay up for good, e.g. because its transaction reverted"""
+        self._set_state(key, FAILED, error=str(error) if error is not None else None)
+
+    def mark_error(self, key, error):
+        """
+            Records a failed attempt to send the relay (before anything reached the node)
+            The row goes to RETRY, or to FAILED once it has failed MAX_ATTEMPTS times. Returns the new state
+        """
+        attempts = self.conn.execute(
+            "SELECT attempts FROM relays WHERE source_tx = ? AND log_index = ?", tuple(key)
+        ).fetchone()[0] + 1
+        state = RETRY if attempts < MAX_ATTEMPTS else FAILED
+        self.conn.execute(
+            "UPDATE relays SET state = ?, attempts = ?, error = ?, updated_at = ? WHERE source_tx = ? AND log_index = ?",
+            (state, attempts, str(error), time.time(), key[0], key[1])
+        )
+        self.conn.commit()
+        if state == FAILED:
+            print(f"Relay {key} failed {attempts} time(s), giving up: {error}")
+        return state
+
+    def _set_state(self, key, state, relay_tx=None, error=None):
+        self.conn.execute(
+            "UPDATE relays SET state = ?, relay_tx = COALESCE(?, relay_tx), error = ?, updated_at = ?"
+            " WHERE source_tx = ? AND log_index = ?",
+            (state, relay_tx, error, time.time(), key[0], key[1])
+        )
+        self.conn.commit()
+
+    def state(self, key):
+        row = self.conn.execute("SELECT state FROM relays WHERE source_tx = ? AND log_index = ?", tuple(key)).fetchone()
+        return row[0] if row else None
+
+    def unfinished(self, states=UNFINISHED, due_only=False):
+        """
+            Rows a crashed run (or a failed send) left behind, as dicts, oldest block first
+            PENDING and RETRY rows still need their relay sent, SIGNED rows need their stored raw_tx sent
+            again (never a new transaction, the first one may already be in a mempool), SUBMITTED rows only
+            need their receipt
+            states - only return rows in these states
+            due_only - leave out RETRY rows whose last failure was less than RETRY_DELAY * 2^(attempts - 1)
+                       seconds ago, so a short RPC outage does not use up MAX_ATTEMPTS at once
+        """
+        due = " AND (state != ? OR updated_at + ? * (1 << (attempts - 1)) <= ?)" if due_only else ""
+        rows = self.conn.execute(
+            "SELECT source_tx, log_index, chain, block_number, target_chain, function_name, args, relay_tx, state,"
+            f" raw_tx, nonce FROM relays WHERE state IN ({', '.join('?' * len(states))}){due} ORDER BY block_number, log_index",
+            tuple(states) + ((RETRY, RETRY_DELAY, time.time()) if due_only else ())
+        ).fetchall()
+        columns = ['source_tx', 'log_index', 'chain', 'block_number', 'target_chain', 'function_name', 'args', 'relay_tx', 'state',
+                   'raw_tx', 'nonce']
+        unfinished = []
+        for row in rows:
+            d = dict(zip(columns, row))
+            d['key'] = (d['source_tx'], d['log_index'])
+            d['args'] = json.loads(d['args'])
+            unfinished.append(d)
+        return unfinished
+
+    def rollback(self, chain, from_block, keep=()):
+        """
+            Forgets the events seen on chain at or after from_block (after a reorg) so they are scanned again
+            Only PENDING, RETRY and FAILED rows are removed: a SIGNED, SUBMITTED or CONFIRMED relay may already be on
+            the other chain, keeping its row is what stops the re-scanned event from being relayed twice
+            keep - keys of rows to keep whatever their state, e.g. PENDING rows already queued to be sent
+            Returns the number of rows removed
+        """
+        rows = self.conn.execute(
+            "SELECT source_tx, log_index, state FROM relays WHERE chain = ? AND block_number >= ?",
+            (chain, from_block)
+        ).fetchall()
+        keep = {tuple(key) for key in keep}
+        removed = [(tx, index) for tx, index, state in rows if state in (PENDING, RETRY, FAILED) and (tx, index) not in keep]
+        kept = len(rows) - len(removed)
+        if kept:
+            print(f"Warning: {kept} relay(s) from reorged {chain} blocks >= {from_block} were already sent or queued")
+        self.conn.executemany("DELETE FROM relays WHERE source_tx = ? AND log_index = ?", removed)
+        self.conn.commit()
+        self._seen.difference_update(removed)
+        return len(removed)
+
+    def counts(self):
+        """Returns {state: number of rows}"""
+        return dict(self.conn.execute("SELECT state, COUNT(*) FROM relays GROUP BY state").fetchall())
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,97 @@
+"""
+    Finality helpers shared by the bridge and the Deposit scanners
+
+    Scanners only read up to the confirmed head (latest block minus a per-chain confirmation depth),
+    and remember the hashes of the last blocks they scanned. If one of those hashes changes, the chain
+    reorganized below the confirmation depth and everything after the newest still-matching block
+    has to be rolled back and scanned again
+"""
+from collections import OrderedDict
+
+# Blocks to stay behind the head, per chain name used in this repo
+CONFIRMATIONS = {
+    'source': 6, 'avax': 6, # AVAX C-chain finalizes in about a second, a few blocks is plenty
+    'destination': 15, 'bsc': 15, # BSC can reorg a few blocks deep, 15 blocks is under a minute at 3s blocks
+}
+DEFAULT_CONFIRMATIONS = 12
+HASH_CACHE_SIZE = 64 # Recent scanned block hashes remembered per chain
+
+
+def confirmations_for(chain):
+    return CONFIRMATIONS.get(chain, DEFAULT_CONFIRMATIONS)
+
+
+def confirmed_head(w3, chain, latest_block=None):
+    """Returns the newest block of chain that has at least confirmations_for(chain) blocks on top of it"""
+    if latest_block is None:
+        latest_block = w3.eth.get_block_number()
+    return max(0, latest_block - confirmations_for(chain))
+
+
+class BlockHashCache:
+    """Hashes of recently scanned blocks of one chain, oldest first"""
+
+    def __init__(self, maxsize=HASH_CACHE_SIZE, entries=()):
+        self.maxsize = maxsize
+        self.hashes = OrderedDict()
+        for block_number, block_hash in entries:
+            self.record(block_number, block_hash)
+
+    def record(self, block_number, block_hash):
+        # Anything above block_number belongs to a branch we no longer follow
+        for n in [n for n in self.hashes if n >= block_number]:
+            del self.hashes[n]
+        self.hashes[block_number] = bytes(block_hash)
+        while len(self.hashes) > self.maxsize:
+            self.hashes.popitem(last=False)
+
+    def newest_first(self):
+        return list(reversed(self.hashes.items()))
+
+    def forget_after(self, block_number):
+        for n in [n for n in self.hashes if n > block_number]:
+            del self.hashes[n]
+
+    def items(self):
+        return list(self.hashes.items())
+
+    def __len__(self):
+        return len(self.hashes)
+
+
+def find_fork(cache, w3):
+    """
+        Compares the cached hashes with the chain, newest first
+        Returns None if the newest cached block is still canonical (one get_block call), otherwise the
+        newest cached block that still matches, i.e. everything after it must be rolled back
+        If no cached block matches, the reorg is deeper than anything remembered and the block before
+        the oldest cached one is returned
+    """
+    entries = cache.newest_first()
+    for i, (block_number, block_hash) in enumerate(entries):
+        if bytes(w3.eth.get_block(block_number)['hash']) == block_hash:
+            if i == 0:
+                return None
+            cache.forget_after(block_number)
+            return block_number
+    if not entries:
+        return None
+    oldest = entries[-1][0]
+    cache.forget_after(oldest - 1)
+    return oldest - 1
+
+
+async def async_find_fork(cache, w3):
+    """find_fork for an AsyncWeb3 instance"""
+    entries = cache.newest_first()
+    for i, (block_number, block_hash) in enumerate(entries):
+        if bytes((await w3.eth.get_block(block_number))['hash']) == block_hash:
+            if i == 0:
+                return None
+            cache.forget_after(block_number)
+            return block_number
+    if not entries:
+        return None
+    oldest = entries[-1][0]
+    cache.forget_after(oldest - 1)
+    return oldest - 1
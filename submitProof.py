@@ -7,6 +7,10 @@ from web3 import Web3
 from web3.middleware import ExtraDataToPOAMiddleware  # Necessary for POA chains
 from eth_account.messages import encode_defunct
 
+from merkle_cache import MerkleCache, onchain_merkle_root
+from merkle_engine import MerkleTree, verify_proof
+from primes import first_primes
+
 
 def merkle_assignment():
     """
@@ -23,11 +27,19 @@ def merkle_assignment():
     leaves = convert_leaves(primes)
 
     # Build a Merkle tree using the bytes32 leaves as the Merkle tree's leaves
-    tree = build_merkle(leaves)
+    # (mapped from the on-disk cache when an earlier run already built it, the contract's root is
+    # only read to check a freshly built tree)
+    cache = MerkleCache()
+    tree = cache.get_or_build(leaves, expected_root=lambda: get_merkle_root('bsc'))
 
     # Select a random leaf and create a proof for that leaf
     random_leaf_index = random.randint(1, 8191) #TODO generate a random index from primes to claim (0 is already claimed)
     proof = prove_merkle(tree, random_leaf_index)
+    if not cache.misses and not verify_proof(tree.root, leaves[random_leaf_index], proof):
+        # The spot checks of a cached tree do not cover every node, this leaf's path is damaged
+        print(f"Cached tree gives a bad proof for leaf {random_leaf_index}, rebuilding it")
+        tree = cache.get_or_build(leaves, expected_root=lambda: get_merkle_root('bsc'), rebuild=True)
+        proof = prove_merkle(tree, random_leaf_index)
 
     # This is the same way the grader generates a challenge for sign_challenge()
     challenge = ''.join(random.choice(string.ascii_letters) for i in range(32))
@@ -36,9 +48,22 @@ def merkle_assignment():
 
     if sign_challenge_verify(challenge, addr, sig):
         tx_hash = '0x'
+        # A proof the contract would reject is caught here instead of reverting on chain
+        if not verify_proof(tree.root, leaves[random_leaf_index], proof):
+            print(f"Proof for leaf {random_leaf_index} does not verify against the tree root, not submitting it")
+            return
         # TODO, when you are ready to attempt to claim a prime (and pay gas fees),
         #  complete this method and run your code with the following line un-commented
-        tx_hash = send_signed_msg(proof, leaves[random_leaf_index])
+        try:
+            tx_hash = send_signed_msg(proof, leaves[random_leaf_index])
+        except ProofRootMismatch as e:
+            if cache.misses:
+                raise # The tree was already built in this run
+            # The cached tree is stale or damaged, rebuild it (rewriting the cache) and try once more
+            print(f"{e}, rebuilding the cached tree")
+            tree = cache.get_or_build(leaves, expected_root=lambda: get_merkle_root('bsc'), rebuild=True)
+            proof = prove_merkle(tree, random_leaf_index)
+            tx_hash = send_signed_msg(proof, leaves[random_leaf_index])
 
 
 def generate_primes(num_primes):
@@ -46,23 +71,8 @@ def generate_primes(num_primes):
         Function to generate the first 'num_primes' prime numbers
         returns list (with length n) of primes (as ints) in ascending order
     """
-    primes_list = []
-
-    #TODO YOUR CODE HERE
-    n = 2
-    while len(primes_list) < num_primes:
-        is_prime = True
-        for p in primes_list:
-            if p * p > n:
-                break
-            if n % p == 0:
-                is_prime = False
-                break
-        if is_prime:
-            primes_list.append(n)
-        n += 1
-
-    return primes_list
+    # Segmented sieve, the same list trial division gave but fast enough for millions of leaves
+    return first_primes(num_primes)
 
 
 def convert_leaves(primes_list):
@@ -90,28 +100,15 @@ def build_merkle(leaves):
         the root hash produced by the "hash_pair" helper function
     """
 
-    #TODO YOUR CODE HERE
-
     if not leaves:
         return []
 
     # Validate leaves are bytes32 (32 bytes)
     assert all(isinstance(leaf, bytes) and len(leaf) == 32 for leaf in leaves), "Leaves must be bytes32"
 
-    tree = [leaves.copy()]  # Start with copy of leaves
-    current_level = leaves
-
-    while len(current_level) > 1:
-        next_level = []
-        for i in range(0, len(current_level), 2):
-            left = current_level[i]
-            right = current_level[i+1] if i+1 < len(current_level) else left
-            parent = hash_pair(left, right)
-            next_level.append(parent)
-        tree.append(next_level)
-        current_level = next_level
-
-    return tree
+    # Levels are kept as contiguous byte arrays and hashed with raw keccak, the nodes are the ones
+    # hash_pair gives, and the tree still indexes like a list of levels
+    return MerkleTree.from_leaves(leaves)
 
 
 def prove_merkle(merkle_tree, random_indx):
@@ -121,13 +118,15 @@ def prove_merkle(merkle_tree, random_indx):
         parent hash values, up to index -1 which is the list of the root hash.
         returns a proof of inclusion as list of values
     """
-    merkle_proof = []
-    # TODO YOUR CODE HERE
+    if isinstance(merkle_tree, MerkleTree):
+        return merkle_tree.proof(random_indx)
 
+    merkle_proof = []
     for level in merkle_tree[:-1]:  # Don't include root
         sibling_index = random_indx ^ 1  # XOR flips last bit to get sibling
-        if sibling_index < len(level):
-            merkle_proof.append(level[sibling_index])
+        if sibling_index >= len(level):
+            sibling_index = random_indx  # The last node of an odd level is hashed with itself
+        merkle_proof.append(level[sibling_index])
         random_indx //= 2  # Move to parent index 
 
     return merkle_proof
@@ -153,11 +152,17 @@ def sign_challenge(challenge):
 
 
 
-def send_signed_msg(proof, random_leaf):
+class ProofRootMismatch(ValueError):
+    """Raised by send_signed_msg when the proof does not lead to the contract's root"""
+
+
+def send_signed_msg(proof, random_leaf, root=None):
     """
         Takes a Merkle proof of a leaf, and that leaf (in bytes32 format)
         builds signs and sends a transaction claiming that leaf (prime)
         on the contract
+        The proof is checked against root (the contract's merkleRoot if not given) first,
+        and ProofRootMismatch (a ValueError) is raised instead of sending a submit that would revert
     """
     chain = 'bsc'
 
@@ -168,6 +173,11 @@ def send_signed_msg(proof, random_leaf):
     # Create contract instance
     contract = w3.eth.contract(address=contract_address, abi=abi)
     
+    if root is None:
+        root = onchain_merkle_root(contract)
+    if not verify_proof(root, random_leaf, proof):
+        raise ProofRootMismatch(f"Proof does not verify against root {bytes(root).hex()}, the submit would revert")
+
     
     # Build transaction
     tx = {
@@ -202,6 +212,20 @@ def send_signed_msg(proof, random_leaf):
     return tx_hash.hex()
 
 
+def get_merkle_root(chain):
+    """
+        Returns the merkleRoot of the contract on chain (bytes32), or None if it cannot be read
+        Used to check a newly built Merkle tree against the contract
+    """
+    try:
+        contract_address, abi = get_contract_info(chain)
+        w3 = connect_to(chain)
+        return onchain_merkle_root(w3.eth.contract(address=contract_address, abi=abi))
+    except Exception as e:
+        print(f"Could not read the merkleRoot on {chain}: {e}")
+        return None
+
+
 # Helper functions that do not need to be modified
 def connect_to(chain):
     """
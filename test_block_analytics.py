@@ -0,0 +1,82 @@
+"""
+	Checks block_analytics against the original is_ordered_block (sort a copy of the priority fees and
+	compare) on the blocks in ordering_blocks.json, without a node
+
+	The fixture holds blocks in record_fixture format: pre-London blocks with gasPrice only, London blocks
+	mixing type 0, 1 and 2 transactions (including type 2 fees capped by maxFeePerGas - baseFeePerGas),
+	ties, empty blocks and busy blocks with an out-of-order bundle
+
+	python -m pytest -q test_block_analytics.py
+"""
+import os
+
+from web3.datastructures import AttributeDict
+
+from block_analytics import analyze_block, analyze_range, fixture_fetcher, load_fixture, summarize
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ordering_blocks.json")
+
+
+def baseline_is_ordered_block(w3, block_num):
+	"""reading_the_chain.is_ordered_block as it was before block_analytics, kept as the reference"""
+	block = w3.eth.get_block(block_num, full_transactions=True)
+	transactions = block.transactions
+	base_fee = getattr(block, 'baseFeePerGas', 0)
+	priority_fees = []
+	for tx in transactions:
+		if hasattr(tx, 'maxPriorityFeePerGas') and hasattr(tx, 'maxFeePerGas'):
+			priority_fee = min(tx.maxPriorityFeePerGas, tx.maxFeePerGas - base_fee)
+		else:
+			priority_fee = tx.gasPrice - base_fee if hasattr(tx, 'gasPrice') else 0
+		priority_fees.append(priority_fee)
+	return priority_fees == sorted(priority_fees, reverse=True)
+
+
+class FixtureEth:
+	"""w3.eth stand-in serving the fixture blocks as web3 returns them (AttributeDicts)"""
+
+	def __init__(self, blocks):
+		self.blocks = blocks
+
+	def get_block(self, block_num, full_transactions=False):
+		return AttributeDict.recursive(self.blocks[block_num])
+
+
+class FixtureWeb3:
+	def __init__(self, blocks):
+		self.eth = FixtureEth(blocks)
+
+
+def test_fixture_covers_both_outcomes():
+	blocks = load_fixture(FIXTURE)
+	w3 = FixtureWeb3(blocks)
+	outcomes = {baseline_is_ordered_block(w3, n) for n in blocks}
+	assert outcomes == {True, False}
+
+
+def test_analyze_block_matches_baseline():
+	blocks = load_fixture(FIXTURE)
+	w3 = FixtureWeb3(blocks)
+	for n, block in blocks.items():
+		assert analyze_block(block)['ordered'] == baseline_is_ordered_block(w3, n), f"block {n}"
+
+
+def test_analyze_block_on_web3_blocks():
+	# The same answer for AttributeDicts straight from a node as for the plain dicts of a fixture
+	blocks = load_fixture(FIXTURE)
+	w3 = FixtureWeb3(blocks)
+	for n in blocks:
+		assert analyze_block(w3.eth.get_block(n, full_transactions=True))['ordered'] == baseline_is_ordered_block(w3, n)
+
+
+def test_analyze_range_replays_fixture():
+	blocks = load_fixture(FIXTURE)
+	w3 = FixtureWeb3(blocks)
+	start_block, end_block = min(blocks), max(blocks)
+	# Small batches and few workers so the sliding window wraps around several times
+	reports, stats, _ = analyze_range(fixture_fetcher(FIXTURE), start_block, end_block, batch_size=3, workers=2)
+	assert [r['number'] for r in reports] == list(range(start_block, end_block + 1))
+	assert [r['ordered'] for r in reports] == [baseline_is_ordered_block(w3, n) for n in range(start_block, end_block + 1)]
+	assert stats == summarize(reports)
+	assert stats['blocks'] == len(blocks)
+	assert stats['empty_blocks'] == sum(not b['transactions'] for b in blocks.values())
@@ -0,0 +1,198 @@
+import json
+import sqlite3
+import time
+
+from bridge import ChainRegistry, load_warden_account, resume_unfinished, scan_blocks
+from bridge import CONTRACT_INFO_FILE, SECRET_KEY_FILE, SCAN_BLOCK_RANGE
+from nonce_manager import NonceManager
+from relay_ledger import RelayLedger, SIGNED, RETRY
+from reorg import BlockHashCache, confirmed_head, find_fork
+
+# --- Configuration ---
+CHECKPOINT_DB = "warden.db"
+CHAINS = ['source', 'destination']
+POLL_INTERVAL = 5 # Seconds to sleep once both chains are caught up
+MAX_BLOCKS_PER_PASS = 2000 # Largest window handed to scan_blocks in one go
+
+
+class CheckpointStore:
+    """
+        Persists the last fully processed block for each chain in a SQLite table
+        so a restarted warden resumes exactly where the previous run stopped
+    """
+
+    def __init__(self, path=CHECKPOINT_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            " chain TEXT PRIMARY KEY,"
+            " last_block INTEGER NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS block_hashes ("
+            " chain TEXT NOT NULL,"
+            " block_number INTEGER NOT NULL,"
+            " hash BLOB NOT NULL,"
+            " PRIMARY KEY (chain, block_number))"
+        )
+        self.conn.commit()
+        self.hash_caches = {}
+
+    def get(self, chain):
+        """Returns the last processed block for chain, or None if the chain was never scanned"""
+        row = self.conn.execute("SELECT last_block FROM checkpoints WHERE chain = ?", (chain,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, chain, block_number):
+        self.conn.execute(
+            "INSERT INTO checkpoints (chain, last_block, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(chain) DO UPDATE SET last_block = excluded.last_block, updated_at = excluded.updated_at",
+            (chain, block_number, time.time())
+        )
+        self.conn.commit()
+
+    def hash_cache(self, chain):
+        """BlockHashCache of the recently scanned blocks of chain, loaded from the database the first time"""
+        if chain not in self.hash_caches:
+            rows = self.conn.execute(
+                "SELECT block_number, hash FROM block_hashes WHERE chain = ? ORDER BY block_number", (chain,)
+            ).fetchall()
+            self.hash_caches[chain] = BlockHashCache(entries=rows)
+        return self.hash_caches[chain]
+
+    def save_hashes(self, chain):
+        cache = self.hash_cache(chain)
+        self.conn.execute("DELETE FROM block_hashes WHERE chain = ?", (chain,))
+        self.conn.executemany(
+            "INSERT INTO block_hashes (chain, block_number, hash) VALUES (?, ?, ?)",
+            [(chain, n, h) for n, h in cache.items()]
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def catch_up(chain, contracts_info, warden_account, store, registry, nonce_manager=None, ledger=None):
+    """
+        Scans the next window (at most MAX_BLOCKS_PER_PASS blocks) after the checkpoint of chain
+        and advances the checkpoint past the blocks whose events were all relayed
+        Only confirmed blocks are scanned, and if a block scanned earlier was reorged out the checkpoint
+        and the ledger rows after the fork are rolled back first
+        Returns how many blocks chain is still behind the confirmed head
+    """
+    w3 = registry.w3(chain)
+    hashes = store.hash_cache(chain)
+    fork_block = find_fork(hashes, w3)
+    if fork_block is not None:
+        print(f"Reorg detected on {chain}, rolling back to block {fork_block}")
+        if ledger is not None:
+            removed = ledger.rollback(chain, fork_block + 1)
+            print(f"Removed {removed} ledger row(s) from the reorged blocks")
+        store.set(chain, fork_block)
+        store.save_hashes(chain)
+
+    latest_block = confirmed_head(w3, chain)
+    last_block = store.get(chain)
+    if last_block is None:
+        # First run on this chain: start with the same window the one-shot script used
+        last_block = max(-1, latest_block - SCAN_BLOCK_RANGE)
+
+    if last_block >= latest_block:
+        return 0
+
+    start_block = last_block + 1
+    end_block = min(latest_block, start_block + MAX_BLOCKS_PER_PASS - 1)
+    # Taken before the scan, so a reorg that happens during the scan is caught on the next pass
+    end_hash = w3.eth.get_block(end_block)['hash']
+    if len(hashes) == 0 and start_block > 0:
+        # Anchor below the first window, so a reorg inside it has a known-good block to fall back to
+        hashes.record(start_block - 1, w3.eth.get_block(start_block - 1)['hash'])
+    scanned = scan_blocks(chain, contracts_info, warden_account, start_block=start_block, end_block=end_block,
+                          registry=registry, nonce_manager=nonce_manager, ledger=ledger)
+    if scanned is None or scanned < start_block:
+        # Leave the checkpoint alone so the same window is retried on the next pass
+        print(f"Scan of {chain} blocks {start_block}-{end_block} failed, will retry")
+        return latest_block - last_block
+
+    store.set(chain, scanned)
+    # A failed relay stops the scan early, the checkpoint then only moves up to the block before it
+    hashes.record(scanned, end_hash if scanned == end_block else w3.eth.get_block(scanned)['hash'])
+    store.save_hashes(chain)
+    return latest_block - scanned
+
+
+def run_warden(contracts_info, warden_account, store, registry=None, nonce_manager=None, ledger=None,
+               poll_interval=POLL_INTERVAL, max_passes=None):
+    """
+        Keeps both chains caught up, alternating one window per chain per pass
+        registry - ChainRegistry shared by the scanner and handlers
+                   (ChainRegistry(connect=...) swaps in a local chain for testing)
+        nonce_manager - NonceManager kept for the life of the warden so nonces stay local between passes
+        ledger - RelayLedger, already relayed events are skipped and relays left unfinished
+                 by a crashed run are completed before scanning resumes. At the start of every pass
+                 signed relays whose send failed are broadcast again, and relays that failed to send
+                 are retried once their backoff is over (until the ledger gives them up)
+        A pass that leaves a chain behind without moving its checkpoint (a relay is still failing)
+        is followed by the same poll_interval sleep as a caught-up pass, instead of spinning
+        max_passes - stop after this many passes (None runs forever)
+    """
+    registry = registry or ChainRegistry()
+    nonce_manager = nonce_manager or NonceManager()
+    if ledger is not None:
+        resume_unfinished(ledger, warden_account, contracts_info, registry, nonce_manager)
+    passes = 0
+    while max_passes is None or passes < max_passes:
+        behind = 0
+        stuck = False
+        if ledger is not None and passes > 0:
+            try:
+                resume_unfinished(ledger, warden_account, contracts_info, registry, nonce_manager, states=(SIGNED, RETRY),
+                                  due_only=True)
+            except Exception as e:
+                print(f"Retrying failed relays failed: {e}")
+        for chain in CHAINS:
+            last_block = store.get(chain)
+            try:
+                chain_behind = catch_up(chain, contracts_info, warden_account, store, registry, nonce_manager, ledger)
+            except Exception as e:
+                print(f"Warden pass failed on {chain}: {e}")
+                stuck = True
+                continue
+            behind += chain_behind
+            stuck = stuck or (chain_behind > 0 and store.get(chain) == last_block)
+        passes += 1
+        # Only sleep once there is nothing left to catch up on, or nothing could be caught up this pass
+        if (behind == 0 or stuck) and (max_passes is None or passes < max_passes):
+            time.sleep(poll_interval)
+    return passes
+
+
+if __name__ == "__main__":
+    print("Starting Bridge Warden...")
+    print(f"Current time: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+
+    with open(CONTRACT_INFO_FILE, 'r') as f:
+        all_contract_info = json.load(f)
+    warden = load_warden_account(SECRET_KEY_FILE)
+
+    if 'warden_address' in all_contract_info and warden.address != all_contract_info['warden_address']:
+        print(f"Warning: Loaded warden address {warden.address} does not match address in {CONTRACT_INFO_FILE} ({all_contract_info['warden_address']})")
+
+    checkpoints = CheckpointStore(CHECKPOINT_DB)
+    registry = ChainRegistry()
+    ledger = RelayLedger(CHECKPOINT_DB)
+    for chain in CHAINS:
+        print(f"Resuming {chain} from block {checkpoints.get(chain)}")
+    try:
+        run_warden(all_contract_info, warden, checkpoints, registry=registry, ledger=ledger)
+    except KeyboardInterrupt:
+        print("\nWarden stopped.")
+    finally:
+        print(f"Connection reuse: {registry.stats()}")
+        print(f"Relay ledger: {ledger.counts()}")
+        registry.close()
+        ledger.close()
+        checkpoints.close()